@@ -2,20 +2,38 @@ from __future__ import annotations
 
 import asyncio
 import logging
+import time
 from datetime import timedelta, datetime
 from typing import TYPE_CHECKING
 
 from homeassistant.core import HomeAssistant
 from homeassistant.config_entries import ConfigEntry
+from homeassistant.exceptions import ConfigEntryNotReady
 from homeassistant.helpers.event import async_track_time_interval
 
 from .const import (
     DOMAIN,
     API,
+    HUB,
+    EVENT_KIND_REFRESH,
+    CONF_ENGINE_PORT,
+    CONF_HEDGE_OPEN,
+    CONF_PRESENCE_WATCHED,
+    CONF_PRESENCE_WINDOW,
+    KEYS,
+    KEYS_REFRESH_INTERVAL,
     PARAM_ACCESS_TOKEN,
     PARAM_REFRESH_TOKEN,
     PARAM_REFRESH_EXPIRATION,
     PLATFORMS,
+    SETUP_TIMINGS,
+    TRACER,
+    CALL_SCHEDULER,
+    CALLS,
+    MESSAGES,
+    PRESENCE,
+    PRESENCE_WINDOW,
+    PREVIEWS,
     UPDATE_INTERVAL,
 )
 
@@ -25,18 +43,42 @@ if TYPE_CHECKING:
 _LOGGER = logging.getLogger(__name__)
 
 
+def _elapsed_ms(since: float) -> float:
+    return round((time.monotonic() - since) * 1000, 1)
+
+
 async def async_setup(hass: HomeAssistant, config: dict) -> bool:
+    from .services import async_setup_services
+
     hass.data.setdefault(DOMAIN, {})
+    async_setup_services(hass)
     return True
 
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     from .api import IntercomAPI
+    from .calls import CallRegistry
+    from .events import EntryEventSink
+    from .hub import async_get_hub
+    from .keys import DomonapKeys
+    from .messages import MessageStore
     from .notify_consumer import IntercomNotifyConsumer
+    from .presence import PresenceTable, parse_watched_users
+    from .previews import PreviewCache
+    from .scheduler import ExpiryScheduler
+    from .tracing import CallTracer
 
+    setup_started = time.monotonic()
     hass.data[DOMAIN].setdefault(entry.entry_id, {})
-
-    api = IntercomAPI()
+    timings: dict[str, float | str] = {}
+    hass.data[DOMAIN][entry.entry_id][SETUP_TIMINGS] = timings
+
+    # HTTP-соединения и подключения к хабу уведомлений общие для всех аккаунтов
+    hub = async_get_hub(hass)
+    api = IntercomAPI(
+        hedge_open_relay=entry.options.get(CONF_HEDGE_OPEN, False),
+        session=hub.acquire(entry.entry_id),
+    )
     api.set_tokens(
         entry.data.get(PARAM_ACCESS_TOKEN),
         entry.data.get(PARAM_REFRESH_TOKEN),
@@ -55,11 +97,78 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
         )
         hass.config_entries.async_update_entry(entry, data=new_data)
 
+    # Уведомления аккаунта может принимать внешний движок (engine.py), тогда локального обработчика нет
+    engine_port = entry.options.get(CONF_ENGINE_PORT, 0)
+
+    def _engine_tokens(access_token: str, refresh_token: str, refresh_expiration_date: str) -> None:
+        # Запоздавшие (более старые) токены от движка не затирают текущие
+        if api.set_tokens_if_newer(access_token, refresh_token, refresh_expiration_date):
+            update_entry(access_token, refresh_token, refresh_expiration_date)
+
     api.token_update_callback = update_entry
+    if engine_port:
+        # Токены обновляет только движок, HA при 401 просит его об этом
+        api.refresh_handler = lambda: hub.async_send_remote(entry.entry_id, EVENT_KIND_REFRESH, {})
+
+    # Сущности создаются из сохранённого списка ключей, свежий список подтягивается в фоне
+    stage_started = time.monotonic()
+    keys = DomonapKeys(hass, entry.entry_id, api)
+    if not await keys.async_load() and await keys.async_refresh() is None:
+        await api.close()
+        await hub.async_release(entry.entry_id)
+        raise ConfigEntryNotReady("Unable to fetch Domonap keys")
+    hass.data[DOMAIN][entry.entry_id][KEYS] = keys
+    timings["keys_ms"] = _elapsed_ms(stage_started)
+    timings["keys_source"] = "snapshot" if keys.from_snapshot else "api"
+
+    scheduler = ExpiryScheduler(hass)
+    hass.data[DOMAIN][entry.entry_id][CALL_SCHEDULER] = scheduler
+    entry.async_on_unload(scheduler.shutdown)
+    calls = CallRegistry(hass, entry, api, scheduler)
+    hass.data[DOMAIN][entry.entry_id][CALLS] = calls
+
+    hass.data[DOMAIN][entry.entry_id][PREVIEWS] = PreviewCache(hub.session)
+
+    messages = MessageStore(hass, entry.entry_id)
+    hass.data[DOMAIN][entry.entry_id][MESSAGES] = messages
+
+    presence = PresenceTable(
+        hass,
+        scheduler,
+        entry.options.get(CONF_PRESENCE_WINDOW, PRESENCE_WINDOW),
+        parse_watched_users(entry.options.get(CONF_PRESENCE_WATCHED, "")),
+    )
+    hass.data[DOMAIN][entry.entry_id][PRESENCE] = presence
 
-    consumer = IntercomNotifyConsumer(hass, api)
+    # Трассировку звонков внешнего движка продолжает получатель событий
+    tracer = CallTracer() if engine_port else None
+    sink = EntryEventSink(
+        hass, calls=calls, messages=messages, presence=presence, on_tokens=_engine_tokens, tracer=tracer
+    )
     hass.data[DOMAIN][entry.entry_id][API] = api
-    hass.data[DOMAIN][entry.entry_id]["notify_consumer"] = consumer
+    if engine_port:
+        consumer = None
+        try:
+            await hub.async_add_remote(
+                entry.entry_id,
+                sink,
+                engine_port,
+                lambda: {
+                    "access_token": api.access_token,
+                    "refresh_token": api.refresh_token,
+                    "refresh_expiration_date": api.refresh_expiration_date,
+                },
+            )
+        except OSError as err:
+            scheduler.shutdown()
+            await api.close()
+            await hub.async_release(entry.entry_id)
+            raise ConfigEntryNotReady(f"Unable to listen for the Domonap engine on port {engine_port}: {err}") from err
+        hass.data[DOMAIN][entry.entry_id][TRACER] = tracer
+    else:
+        consumer = IntercomNotifyConsumer(hass, api, sink=sink, connect_gate=hub.connect_gate)
+        hass.data[DOMAIN][entry.entry_id]["notify_consumer"] = consumer
+        hass.data[DOMAIN][entry.entry_id][TRACER] = consumer.tracer
 
     async def _update_tokens_tick(now: datetime) -> None:
         try:
@@ -67,12 +176,42 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
         except Exception:
             _LOGGER.debug("Token refresh failed", exc_info=True)
 
-    unsub_refresh = async_track_time_interval(hass, _update_tokens_tick, UPDATE_INTERVAL)
-    hass.data[DOMAIN][entry.entry_id]["unsub_refresh"] = unsub_refresh
+    if not engine_port:
+        unsub_refresh = async_track_time_interval(hass, _update_tokens_tick, UPDATE_INTERVAL)
+        hass.data[DOMAIN][entry.entry_id]["unsub_refresh"] = unsub_refresh
+
+    async def _options_updated(hass: HomeAssistant, entry: ConfigEntry) -> None:
+        if entry.options.get(CONF_ENGINE_PORT, 0) != engine_port:
+            # Смена источника уведомлений требует перезагрузки
+            hass.config_entries.async_schedule_reload(entry.entry_id)
+            return
+        # Остальные опции применяются на лету, без перезагрузки интеграции
+        api.hedge_open_relay = entry.options.get(CONF_HEDGE_OPEN, False)
+        presence.configure(
+            entry.options.get(CONF_PRESENCE_WINDOW, PRESENCE_WINDOW),
+            parse_watched_users(entry.options.get(CONF_PRESENCE_WATCHED, "")),
+        )
+
+    entry.async_on_unload(entry.add_update_listener(_options_updated))
 
-    entry.async_create_background_task(hass, consumer.start(), "domonap_notify")
+    if consumer is not None:
+        hub.async_start_consumer(entry, consumer)
 
+    stage_started = time.monotonic()
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
+    timings["platforms_ms"] = _elapsed_ms(stage_started)
+    timings["total_ms"] = _elapsed_ms(setup_started)
+
+    async def _reconcile_keys(now: datetime | None = None) -> None:
+        try:
+            await keys.async_reconcile()
+        except Exception:
+            _LOGGER.debug("Keys reconcile failed", exc_info=True)
+
+    if keys.from_snapshot:
+        entry.async_create_background_task(hass, _reconcile_keys(), "domonap_keys_refresh")
+    entry.async_on_unload(async_track_time_interval(hass, _reconcile_keys, KEYS_REFRESH_INTERVAL))
+
     return True
 
 
@@ -94,6 +233,18 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
 
     unloaded = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
 
+    if (api := stored.get(API)) is not None:
+        await api.close()
+
+    if (hub := hass.data.get(HUB)) is not None:
+        await hub.async_release(entry.entry_id)
+
     hass.data.get(DOMAIN, {}).pop(entry.entry_id, None)
 
-    return unloaded
\ No newline at end of file
+    return unloaded
+
+
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    from .keys import async_remove_snapshot
+
+    await async_remove_snapshot(hass, entry.entry_id)
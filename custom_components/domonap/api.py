@@ -1,11 +1,89 @@
 import logging
 import aiohttp
 import asyncio
+import time
+from collections import deque
 from datetime import datetime, timezone, timedelta
-from typing import Any, Dict, Optional, Union
+from typing import Any, Callable, Dict, Optional, Union
 
 _LOGGER = logging.getLogger(__name__)
 
+# Хеджирование открытия двери: порог считается как p95 последних открытий
+HEDGE_WINDOW = 64
+HEDGE_MIN_SAMPLES = 8
+HEDGE_DEFAULT_DELAY = 1.5
+HEDGE_MIN_DELAY = 0.3
+HEDGE_MAX_DELAY = 5.0
+
+# Границы корзин гистограммы задержек, мс (последняя корзина - всё, что дольше)
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class EndpointStats:
+    """Counters and a fixed-bucket latency histogram for one API path."""
+
+    OK = "ok"
+    ERROR = "error"
+    UNAUTHORIZED = "unauthorized"
+    TIMEOUT = "timeout"
+
+    __slots__ = ("ok", "error", "unauthorized", "timeout", "buckets", "total_ms", "max_ms")
+
+    def __init__(self) -> None:
+        self.ok = 0
+        self.error = 0
+        self.unauthorized = 0
+        self.timeout = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    @property
+    def count(self) -> int:
+        return self.ok + self.error + self.unauthorized + self.timeout
+
+    def record(self, seconds: float, outcome: str) -> None:
+        setattr(self, outcome, getattr(self, outcome) + 1)
+        ms = seconds * 1000
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if ms <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th percentile, in ms."""
+        total = sum(self.buckets)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n:
+                return float(LATENCY_BUCKETS_MS[i]) if i < len(LATENCY_BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def as_dict(self) -> Dict[str, Any]:
+        count = self.count
+        return {
+            "count": count,
+            "ok": self.ok,
+            "error": self.error,
+            "unauthorized": self.unauthorized,
+            "timeout": self.timeout,
+            "avg_ms": round(self.total_ms / count, 1) if count else None,
+            "max_ms": round(self.max_ms, 1),
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "histogram": {
+                **{f"le_{bound}": n for bound, n in zip(LATENCY_BUCKETS_MS, self.buckets)},
+                "inf": self.buckets[-1],
+            },
+        }
+
 
 class IntercomAPI:
     def __init__(
@@ -14,6 +92,8 @@ class IntercomAPI:
         device_token: str = "home-assistant",
         device_token_check_interval: int = 300,
         refresh_skew_seconds: int = 60,
+        hedge_open_relay: bool = False,
+        session: Optional[aiohttp.ClientSession] = None,
     ):
         self.base_url = base_url.rstrip("/")
         self.access_token: Optional[str] = None
@@ -30,20 +110,38 @@ class IntercomAPI:
             "dom-platform": "blazor",
         }
         self.token_update_callback = None
-        self._session: Optional[aiohttp.ClientSession] = None
+        # Если задан, токены обновляет другой владелец аккаунта (внешний движок), а не этот клиент
+        self.refresh_handler: Optional[Callable[[], None]] = None
+        # Общая (пуловая) сессия принадлежит вызывающему и здесь не закрывается
+        self._session: Optional[aiohttp.ClientSession] = session
+        self._owns_session = session is None
+        self._timeout = aiohttp.ClientTimeout(total=30)
         self._closed = False
+        self.endpoint_stats: Dict[str, EndpointStats] = {}
+        self.hedge_open_relay = hedge_open_relay
+        self._open_latencies: deque[float] = deque(maxlen=HEDGE_WINDOW)
+        self.hedge_stats: Dict[str, int] = {
+            "requests": 0,
+            "fired": 0,
+            "hedge_won": 0,
+            "primary_won": 0,
+            "failed": 0,
+        }
 
     async def _ensure_session(self) -> aiohttp.ClientSession:
         if self._closed:
             raise RuntimeError("Client is closed")
+        if not self._owns_session:
+            if self._session.closed:
+                raise RuntimeError("Shared session is closed")
+            return self._session
         if not self._session or self._session.closed:
-            timeout = aiohttp.ClientTimeout(total=30)
-            self._session = aiohttp.ClientSession(headers=self.headers, timeout=timeout)
+            self._session = aiohttp.ClientSession(headers=self.headers, timeout=self._timeout)
         return self._session
 
     async def close(self):
         self._closed = True
-        if self._session and not self._session.closed:
+        if self._owns_session and self._session and not self._session.closed:
             await self._session.close()
 
     async def __aenter__(self):
@@ -58,9 +156,19 @@ class IntercomAPI:
         self.refresh_token = refresh_token
         self.refresh_expiration_date = refresh_expiration_date
         self.headers["Authorization"] = f"Bearer {self.access_token}"
-        if self._session and not self._session.closed:
+        if self._owns_session and self._session and not self._session.closed:
             self._session._default_headers.update(self.headers)
 
+    def set_tokens_if_newer(self, access_token: str, refresh_token: str, refresh_expiration_date: str) -> bool:
+        """Takes the tokens only if their refresh token expires later than the current one."""
+        if self.refresh_expiration_date:
+            current = self._parse_dt(self.refresh_expiration_date)
+            new = self._parse_dt(refresh_expiration_date) if refresh_expiration_date else None
+            if current is not None and (new is None or new <= current):
+                return False
+        self.set_tokens(access_token, refresh_token, refresh_expiration_date)
+        return True
+
     def _parse_dt(self, val: str) -> Optional[datetime]:
         fmts = ("%Y-%m-%dT%H:%M:%S.%f%z", "%Y-%m-%dT%H:%M:%S%z")
         for fmt in fmts:
@@ -122,30 +230,64 @@ class IntercomAPI:
 
         session = await self._ensure_session()
         url = f"{self.base_url}{path}"
+        stats = self.get_endpoint_stats(path)
 
-        async def _do() -> aiohttp.ClientResponse:
-            return await session.post(url, json=payload, ssl=False)
-
-        resp = await _do()
+        async def _do() -> tuple[aiohttp.ClientResponse, float]:
+            started = time.monotonic()
+            try:
+                # Заголовки передаются в каждом запросе: сессия может быть общей для нескольких аккаунтов
+                return await session.post(
+                    url, json=payload, headers=self.headers, timeout=self._timeout, ssl=False
+                ), started
+            except asyncio.TimeoutError:
+                stats.record(time.monotonic() - started, EndpointStats.TIMEOUT)
+                raise
+            except Exception:
+                stats.record(time.monotonic() - started, EndpointStats.ERROR)
+                raise
+
+        resp, started = await _do()
         if resp.status == 401 and retry_on_401 and self.refresh_token:
+            stats.record(time.monotonic() - started, EndpointStats.UNAUTHORIZED)
             _LOGGER.warning("401 Unauthorized, refreshing token and retrying %s", path)
             await self.update_token()
-            resp = await _do()
+            resp, started = await _do()
 
         if 200 <= resp.status < 300:
-            if expect == "json":
-                return await resp.json()
-            return await resp.text()
+            try:
+                if expect == "json":
+                    result = await resp.json()
+                else:
+                    result = await resp.text()
+            except asyncio.TimeoutError:
+                stats.record(time.monotonic() - started, EndpointStats.TIMEOUT)
+                raise
+            except Exception:
+                stats.record(time.monotonic() - started, EndpointStats.ERROR)
+                raise
+            stats.record(time.monotonic() - started, EndpointStats.OK)
+            return result
 
         body_text = ""
         try:
             body_text = await resp.text()
         except Exception:
             pass
+        stats.record(
+            time.monotonic() - started,
+            EndpointStats.UNAUTHORIZED if resp.status == 401 else EndpointStats.ERROR,
+        )
         err = {"error": f"HTTP {resp.status}", "status": resp.status, "body": body_text[:2000]}
         _LOGGER.error("Request failed: POST %s payload=%s -> %s", path, payload, err)
         return err
 
+    def get_endpoint_stats(self, path: str) -> "EndpointStats":
+        key = path.split("?", 1)[0]
+        stats = self.endpoint_stats.get(key)
+        if stats is None:
+            stats = self.endpoint_stats[key] = EndpointStats()
+        return stats
+
     async def update_device_token(self, device_token: str) -> bool:
         _LOGGER.debug("UpdateDeviceToken start")
         result = await self._post(
@@ -193,6 +335,10 @@ class IntercomAPI:
         return res
 
     async def update_token(self) -> Dict[str, Any]:
+        if self.refresh_handler is not None:
+            # Refresh token одноразовый: обновлять его должен только один владелец
+            self.refresh_handler()
+            return {"error": "Token refresh is delegated", "ok": False, "body": ""}
         if not self.refresh_token:
             return {"error": "No refresh token available", "ok": False, "body": ""}
         _LOGGER.info("Begin refreshToken. Old refresh_expiration=%s now=%s", self.refresh_expiration_date, self._now_utc())
@@ -250,6 +396,63 @@ class IntercomAPI:
             return res
         return {"ok": True, "body": res}
 
+    def _hedge_delay(self) -> float:
+        if len(self._open_latencies) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        samples = sorted(self._open_latencies)
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        return min(HEDGE_MAX_DELAY, max(HEDGE_MIN_DELAY, p95))
+
+    async def open_relay(self, key_id: str, door_id: Optional[str] = None):
+        """Open a door by key, optionally hedged with a door-based request.
+
+        When hedging is enabled and the key-based request is slower than the
+        p95 of recent openings, a door-based request is sent as well; the first
+        successful response wins and the other request is cancelled.
+        """
+        started = time.monotonic()
+        if not self.hedge_open_relay or not door_id:
+            res = await self.open_relay_by_key_id(key_id)
+            if isinstance(res, dict) and res.get("ok") is True:
+                self._open_latencies.append(time.monotonic() - started)
+            return res
+
+        self.hedge_stats["requests"] += 1
+        primary = asyncio.ensure_future(self.open_relay_by_key_id(key_id))
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self._hedge_delay())
+            if not done:
+                self.hedge_stats["fired"] += 1
+                _LOGGER.debug("open_relay(%s) is slow, hedging by door %s", key_id, door_id)
+                tasks.add(asyncio.ensure_future(self.open_relay_by_door_id(door_id)))
+
+            pending = set(tasks)
+            first_error: Any = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.cancelled():
+                        continue
+                    if task.exception() is not None:
+                        first_error = first_error or {"error": str(task.exception())}
+                        continue
+                    res = task.result()
+                    if isinstance(res, dict) and res.get("ok") is True:
+                        self._open_latencies.append(time.monotonic() - started)
+                        if len(tasks) > 1:
+                            key = "primary_won" if task is primary else "hedge_won"
+                            self.hedge_stats[key] += 1
+                        return res
+                    if first_error is None or task is primary:
+                        first_error = res
+            self.hedge_stats["failed"] += 1
+            return first_error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
     async def answer_call_notify(self, call_id: str):
         payload = {"callId": call_id}
         res = await self._post("/communication-api/Call/NotifyCallAnswered", payload, need_auth=True, expect="text")
@@ -266,11 +469,15 @@ class IntercomAPI:
         _LOGGER.debug("end_call_notify(%s) -> %s", call_id, res)
         return {"ok": True, "body": res}
 
-    async def get_notify_id_token(self) -> Optional[str]:
+    async def negotiate(self) -> Optional[Dict[str, Any]]:
         res = await self._post("/notificationHub/negotiate?negotiateVersion=1", need_auth=True, expect="json")
-        if isinstance(res, dict) and "error" in res and "status" in res:
+        if not isinstance(res, dict) or ("error" in res and "status" in res):
             _LOGGER.debug("negotiate failed: %s", res)
             return None
-        token = res.get("connectionToken")
+        return res
+
+    async def get_notify_id_token(self) -> Optional[str]:
+        res = await self.negotiate()
+        token = res.get("connectionToken") if res else None
         _LOGGER.debug("get_notify_id_token -> %s", token)
         return token
@@ -1,28 +1,32 @@
 import logging
-from typing import Optional, Callable
+from typing import Optional
 from homeassistant.components.binary_sensor import BinarySensorEntity
 from homeassistant.core import HomeAssistant, callback
-from homeassistant.helpers.event import async_call_later
-from .const import DOMAIN, API, EVENT_INCOMING_CALL, RESET_DELAY
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+from .calls import CallRecord, CallRegistry, CALL_RINGING
+from .const import DOMAIN, API, TRACER, CALLS, SIGNAL_CALL_STATE
+from .keys import async_setup_key_entities
+from .tracing import CallTracer, STAGE_STATE_WRITTEN
 
 _LOGGER = logging.getLogger(__name__)
 
 
 async def async_setup_entry(hass, config_entry, async_add_entities):
     """Настройка binary sensor для каждой двери."""
-    entities = []
     api = hass.data[DOMAIN][config_entry.entry_id][API]
-    response = await api.get_paged_keys()
-    keys = response.get("results", [])
-    
-    for key in keys:
-        key_id = key["id"]
-        door_id = key["doorId"]
-        door_name = key["name"]
-        if key.get("httpVideoUrl") is not None:
-            entities.append(IntercomCallBinarySensor(hass, api, key_id, door_id, door_name))
+    tracer = hass.data[DOMAIN][config_entry.entry_id].get(TRACER)
+    calls = hass.data[DOMAIN][config_entry.entry_id][CALLS]
+
+    def _entities(key):
+        if key.get("httpVideoUrl") is None:
+            return []
+        return [
+            IntercomCallBinarySensor(
+                hass, api, config_entry.entry_id, key["id"], key["doorId"], key["name"], calls, tracer
+            )
+        ]
 
-    async_add_entities(entities, True)
+    async_setup_key_entities(hass, config_entry, async_add_entities, _entities)
 
 
 class IntercomCallBinarySensor(BinarySensorEntity):
@@ -32,16 +36,28 @@ class IntercomCallBinarySensor(BinarySensorEntity):
     _attr_icon = "mdi:phone-incoming"
     _attr_device_class = "running"
     _attr_translation_key = "incoming_call"
+    _attr_should_poll = False
 
-    def __init__(self, hass: HomeAssistant, api, key_id: str, door_id: str, name: str):
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        api,
+        entry_id: str,
+        key_id: str,
+        door_id: str,
+        name: str,
+        calls: CallRegistry,
+        tracer: Optional[CallTracer] = None,
+    ):
         self._hass = hass
         self._api = api
+        self._entry_id = entry_id
         self._key_id = key_id
         self._door_id = door_id
         self._name = name
-        self._state = False
-        self._reset_timer: Optional[Callable[[], None]] = None
-        self._listener = None
+        self._calls = calls
+        self._call: Optional[CallRecord] = None
+        self._tracer = tracer
 
     @property
     def unique_id(self):
@@ -49,8 +65,18 @@ class IntercomCallBinarySensor(BinarySensorEntity):
 
     @property
     def is_on(self):
-        """Возвращает True если есть входящий звонок."""
-        return self._state
+        """Возвращает True пока вызов звонит или идёт разговор."""
+        return self._call is not None and self._call.active
+
+    @property
+    def extra_state_attributes(self):
+        if self._call is None:
+            return None
+        return {
+            "call_id": self._call.call_id,
+            "call_state": self._call.state,
+            "address": self._call.address,
+        }
 
     @property
     def device_info(self):
@@ -63,43 +89,25 @@ class IntercomCallBinarySensor(BinarySensorEntity):
 
     async def async_added_to_hass(self):
         """Вызывается когда entity добавлен в Home Assistant."""
-        self._listener = self._hass.bus.async_listen(
-            EVENT_INCOMING_CALL, self._handle_incoming_call
-        )
-
-    async def async_will_remove_from_hass(self):
-        """Вызывается когда entity удаляется из Home Assistant."""
-        if self._listener:
-            self._listener()
-        if self._reset_timer:
-            self._reset_timer()
-            self._reset_timer = None
-
-    @callback
-    def _handle_incoming_call(self, event):
-        """Обработчик события входящего звонка."""
-        door_id = event.data.get("DoorId")
-        if door_id == self._door_id:
-            _LOGGER.debug(
-                "Incoming call detected for door %s (%s)", self._door_id, self._name
-            )
-            self._state = True
-            self.async_write_ha_state()
-            
-            if self._reset_timer:
-                self._reset_timer()
-            
-            self._reset_timer = async_call_later(
-                self._hass, RESET_DELAY, self._reset_state
+        self._call = self._calls.active_call(self._door_id)
+        self.async_on_remove(
+            async_dispatcher_connect(
+                self._hass, SIGNAL_CALL_STATE.format(self._entry_id), self._handle_call_state
             )
+        )
 
     @callback
-    def _reset_state(self, _now):
-        """Сбрасывает состояние в False через 10 секунд."""
+    def _handle_call_state(self, record: CallRecord):
+        """Обработчик смены состояния вызова."""
+        if record.door_id != self._door_id:
+            return
+        # Более старый вызов не должен перебивать текущий
+        if self._call is not None and self._call is not record and self._call.active and not record.active:
+            return
         _LOGGER.debug(
-            "Resetting call state for door %s (%s)", self._door_id, self._name
+            "Call %s for door %s (%s) is %s", record.call_id, self._door_id, self._name, record.state
         )
-        self._state = False
-        self._reset_timer = None
+        self._call = record
         self.async_write_ha_state()
-
+        if self._tracer and record.state == CALL_RINGING:
+            self._tracer.mark(record.call_id, STAGE_STATE_WRITTEN)
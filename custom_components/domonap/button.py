@@ -1,22 +1,18 @@
 import logging
 from homeassistant.components.button import ButtonEntity
 from .const import DOMAIN, API
+from .keys import async_setup_key_entities
 
 _LOGGER = logging.getLogger(__name__)
 
 
 async def async_setup_entry(hass, config_entry, async_add_entities):
-    entities = []
     api = hass.data[DOMAIN][config_entry.entry_id][API]
-    response = await api.get_paged_keys()
-    keys = response.get("results", [])
-    for key in keys:
-        key_id = key["id"]
-        door_id = key["doorId"]
-        door_name = key["name"]
-        entities.append(IntercomDoor(api, key_id, door_id, door_name))
 
-    async_add_entities(entities, True)
+    def _entities(key):
+        return [IntercomDoor(api, key["id"], key["doorId"], key["name"])]
+
+    async_setup_key_entities(hass, config_entry, async_add_entities, _entities)
 
 
 class IntercomDoor(ButtonEntity):
@@ -46,7 +42,7 @@ class IntercomDoor(ButtonEntity):
 
     async def async_press(self):
         try:
-            response = await self._api.open_relay_by_key_id(self._key_id)
+            response = await self._api.open_relay(self._key_id, self._door_id)
             if response.get('ok') is not True:
                 _LOGGER.error(f"Failed to open the door {self._name}. Response: {response}")
         except Exception as e:
@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import logging
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Optional
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+from homeassistant.util import dt as dt_util
+
+from .api import IntercomAPI
+from .const import (
+    EVENT_CALL_STATE_CHANGED,
+    SIGNAL_CALL_STATE,
+    RESET_DELAY,
+    CALL_MAX_DURATION,
+    CALL_HISTORY_SIZE,
+    CONF_CALL_HOLD_TIME,
+    CONF_CALL_HOLD_OVERRIDES,
+)
+from .scheduler import ExpiryScheduler, parse_hold_overrides
+
+_LOGGER = logging.getLogger(__name__)
+
+CALL_RINGING = "ringing"
+CALL_ANSWERED = "answered"
+CALL_ENDED = "ended"
+CALL_MISSED = "missed"
+
+ACTIVE_CALL_STATES = (CALL_RINGING, CALL_ANSWERED)
+
+
+class CallRecord:
+    __slots__ = ("call_id", "door_id", "address", "photo_url", "state", "started", "answered", "ended")
+
+    def __init__(self, call_id: str, door_id: str, address: Optional[str], photo_url: Optional[str]) -> None:
+        self.call_id = call_id
+        self.door_id = door_id
+        self.address = address
+        self.photo_url = photo_url
+        self.state = CALL_RINGING
+        self.started: datetime = dt_util.utcnow()
+        self.answered: Optional[datetime] = None
+        self.ended: Optional[datetime] = None
+
+    @property
+    def active(self) -> bool:
+        return self.state in ACTIVE_CALL_STATES
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "call_id": self.call_id,
+            "door_id": self.door_id,
+            "address": self.address,
+            "photo_url": self.photo_url,
+            "state": self.state,
+            "started": self.started.isoformat(),
+            "answered": self.answered.isoformat() if self.answered else None,
+            "ended": self.ended.isoformat() if self.ended else None,
+        }
+
+
+class CallRegistry:
+    """Lifecycle of recent calls of one account: ringing -> answered -> ended, or missed."""
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        entry: ConfigEntry,
+        api: IntercomAPI,
+        scheduler: ExpiryScheduler,
+        size: int = 100,
+        history_size: int = CALL_HISTORY_SIZE,
+    ) -> None:
+        self._hass = hass
+        self._entry = entry
+        self._api = api
+        self._scheduler = scheduler
+        self._size = size
+        self._calls: OrderedDict[str, CallRecord] = OrderedDict()
+        self._history_size = history_size
+        self._history: dict[str, deque[CallRecord]] = {}
+
+    def get(self, call_id: str) -> Optional[CallRecord]:
+        return self._calls.get(call_id)
+
+    def active_call(self, door_id: str) -> Optional[CallRecord]:
+        for record in reversed(self._calls.values()):
+            if record.door_id == door_id and record.active:
+                return record
+        return None
+
+    def _door_history(self, door_id: str) -> deque[CallRecord]:
+        history = self._history.get(door_id)
+        if history is None:
+            history = self._history[door_id] = deque(maxlen=self._history_size)
+        return history
+
+    def history(
+        self,
+        door_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+        limit: Optional[int] = None,
+    ) -> list[CallRecord]:
+        """Recent calls, newest first, for one door or all doors."""
+        if door_id is not None:
+            records = list(reversed(self._history.get(door_id, ())))
+        else:
+            records = sorted(
+                (r for h in self._history.values() for r in h), key=lambda r: r.started, reverse=True
+            )
+        if since is not None:
+            records = [r for r in records if r.started >= since]
+        return records[:limit] if limit else records
+
+    def hold_time(self, door_id: str) -> float:
+        options = self._entry.options
+        try:
+            overrides = parse_hold_overrides(options.get(CONF_CALL_HOLD_OVERRIDES, ""))
+        except ValueError:
+            overrides = {}
+        return overrides.get(door_id, options.get(CONF_CALL_HOLD_TIME, RESET_DELAY))
+
+    @callback
+    def ringing(self, push_data: dict[str, Any]) -> Optional[CallRecord]:
+        call_id = str(push_data.get("CallId") or "")
+        door_id = push_data.get("DoorId")
+        if not call_id or not door_id:
+            return None
+        record = self._calls.get(call_id)
+        if record is None:
+            record = CallRecord(call_id, door_id, push_data.get("Address"), push_data.get("PhotoUrl"))
+            self._calls[call_id] = record
+            self._door_history(door_id).append(record)
+            while len(self._calls) > self._size:
+                old_id, _old = self._calls.popitem(last=False)
+                self._scheduler.cancel(old_id)
+        elif not record.active:
+            # Повторный пуш по уже завершённому вызову
+            return record
+        self._scheduler.schedule(call_id, self.hold_time(door_id), lambda: self._transition(call_id, CALL_MISSED))
+        self._notify(record)
+        return record
+
+    @callback
+    def remote_ended(self, push_data: dict[str, Any]) -> None:
+        call_id = str(push_data.get("CallId") or "")
+        record = self._calls.get(call_id)
+        if record is None:
+            return
+        self._transition(call_id, CALL_ENDED if record.state == CALL_ANSWERED else CALL_MISSED)
+
+    async def async_answer(self, call_id: str) -> dict[str, Any]:
+        res = await self._api.answer_call_notify(call_id)
+        if isinstance(res, dict) and res.get("ok") is True:
+            self._transition(call_id, CALL_ANSWERED)
+        return res
+
+    async def async_end(self, call_id: str) -> dict[str, Any]:
+        res = await self._api.end_call_notify(call_id)
+        if isinstance(res, dict) and res.get("ok") is True:
+            self._transition(call_id, CALL_ENDED)
+        return res
+
+    @callback
+    def _transition(self, call_id: str, state: str) -> None:
+        record = self._calls.get(call_id)
+        if record is None or not record.active or record.state == state:
+            return
+        record.state = state
+        if state == CALL_ANSWERED:
+            record.answered = dt_util.utcnow()
+            # Отвеченный вызов завершается, даже если сигнал о завершении не пришёл
+            self._scheduler.schedule(call_id, CALL_MAX_DURATION, lambda: self._transition(call_id, CALL_ENDED))
+        else:
+            record.ended = dt_util.utcnow()
+            self._scheduler.cancel(call_id)
+        _LOGGER.debug("Call %s on door %s is %s", call_id, record.door_id, state)
+        self._notify(record)
+
+    @callback
+    def _notify(self, record: CallRecord) -> None:
+        async_dispatcher_send(self._hass, SIGNAL_CALL_STATE.format(self._entry.entry_id), record)
+        self._hass.bus.async_fire(EVENT_CALL_STATE_CHANGED, record.as_dict())
+
+    def as_dict(self) -> list[dict[str, Any]]:
+        return [record.as_dict() for record in reversed(self._calls.values())]
@@ -1,4 +1,3 @@
-import aiohttp
 import logging
 from homeassistant.components.camera import (
     Camera,
@@ -6,22 +5,24 @@ from homeassistant.components.camera import (
     CameraEntityDescription,
     StreamType,
 )
-from .const import DOMAIN, API
+from homeassistant.core import callback
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+from .const import DOMAIN, API, PREVIEWS, SIGNAL_KEY_UPDATED
+from .keys import async_setup_key_entities
 
 _LOGGER = logging.getLogger(__name__)
 
 
 async def async_setup_entry(hass, config_entry, async_add_entities):
-    entities = []
     api = hass.data[DOMAIN][config_entry.entry_id][API]
-    response = await api.get_paged_keys()
-    keys = response.get("results", [])
-    for key in keys:
-        key_id = key["id"]
-        if key["httpVideoUrl"] is not None:
-            entities.append(IntercomCamera(api, key_id, key["name"], key["httpVideoUrl"], key["videoPreview"]))
+    previews = hass.data[DOMAIN][config_entry.entry_id][PREVIEWS]
 
-    async_add_entities(entities, True)
+    def _entities(key):
+        if key.get("httpVideoUrl") is None:
+            return []
+        return [IntercomCamera(api, previews, key["id"], key["name"], key["httpVideoUrl"], key.get("videoPreview"))]
+
+    async_setup_key_entities(hass, config_entry, async_add_entities, _entities)
 
 
 class IntercomCamera(Camera):
@@ -31,9 +32,10 @@ class IntercomCamera(Camera):
     _attr_motion_detection_enabled = False
     _attr_translation_key = "camera"
 
-    def __init__(self, api, key_id: str, name: str, stream_url: str, snapshot_url: str):
+    def __init__(self, api, previews, key_id: str, name: str, stream_url: str, snapshot_url: str):
         super().__init__()
         self._api = api
+        self._previews = previews
         self._key_id = key_id
         self._name = name
         self._stream_url = stream_url
@@ -43,19 +45,27 @@ class IntercomCamera(Camera):
     def unique_id(self):
         return self._key_id
 
+    async def async_added_to_hass(self):
+        self.async_on_remove(
+            async_dispatcher_connect(
+                self.hass, SIGNAL_KEY_UPDATED.format(self._key_id), self._handle_key_update
+            )
+        )
+
+    @callback
+    def _handle_key_update(self, key):
+        self._stream_url = key.get("httpVideoUrl") or self._stream_url
+        self._snapshot_url = key.get("videoPreview") or self._snapshot_url
+        self.async_write_ha_state()
+
     async def async_camera_image(self, width=None, height=None):
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(self._snapshot_url) as response:
-                    if response.status == 200:
-                        _LOGGER.debug(f"Successfully fetched snapshot for {self._name}")
-                        return await response.read()
-                    else:
-                        _LOGGER.error(f"Failed to fetch snapshot, HTTP {response.status}")
-                        return None
-        except Exception as e:
-            _LOGGER.error(f"Error fetching snapshot from {self._snapshot_url}: {e}")
+        if not self._snapshot_url:
             return None
+        # Общий кэш с сущностью превью: повторные запросы к той же двери не уходят в сеть
+        data, _digest = await self._previews.async_get(self._snapshot_url)
+        if data is None:
+            _LOGGER.error(f"Failed to fetch snapshot from {self._snapshot_url}")
+        return data
 
     async def stream_source(self):
         return self._stream_url
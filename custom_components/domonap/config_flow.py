@@ -1,8 +1,11 @@
 from homeassistant import config_entries
+from homeassistant.core import callback
 import voluptuous as vol
 import re
 from .const import DOMAIN, CONF_COUNTRY_CODE, CONF_PHONE_NUMBER, CONF_CONFIRM_CODE, PARAM_REFRESH_EXPIRATION, \
-    PARAM_REFRESH_TOKEN, PARAM_ACCESS_TOKEN
+    PARAM_REFRESH_TOKEN, PARAM_ACCESS_TOKEN, CONF_HEDGE_OPEN, CONF_CALL_HOLD_TIME, CONF_CALL_HOLD_OVERRIDES, \
+    CONF_PRESENCE_WINDOW, CONF_PRESENCE_WATCHED, CONF_ENGINE_PORT, RESET_DELAY, PRESENCE_WINDOW
+from .scheduler import parse_hold_overrides
 from .api import IntercomAPI
 
 
@@ -66,4 +69,43 @@ class IntercomFlowHandler(config_entries.ConfigFlow, domain=DOMAIN):
 
     def _sanitize_number(self, input_string):
         sanitized = re.sub(r'\D', '', input_string)
-        return sanitized
\ No newline at end of file
+        return sanitized
+
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry):
+        return IntercomOptionsFlowHandler(config_entry)
+
+
+class IntercomOptionsFlowHandler(config_entries.OptionsFlow):
+
+    def __init__(self, config_entry):
+        self._config_entry = config_entry
+
+    async def async_step_init(self, user_input=None):
+        errors = {}
+        if user_input is not None:
+            try:
+                parse_hold_overrides(user_input.get(CONF_CALL_HOLD_OVERRIDES, ""))
+            except ValueError:
+                errors[CONF_CALL_HOLD_OVERRIDES] = "invalid_hold_overrides"
+            else:
+                return self.async_create_entry(title="", data=user_input)
+
+        options = self._config_entry.options
+        data_schema = vol.Schema({
+            vol.Optional(CONF_HEDGE_OPEN, default=options.get(CONF_HEDGE_OPEN, False)): bool,
+            vol.Optional(CONF_CALL_HOLD_TIME, default=options.get(CONF_CALL_HOLD_TIME, RESET_DELAY)): vol.All(
+                vol.Coerce(int), vol.Range(min=1, max=600)
+            ),
+            vol.Optional(CONF_CALL_HOLD_OVERRIDES, default=options.get(CONF_CALL_HOLD_OVERRIDES, "")): str,
+            vol.Optional(CONF_PRESENCE_WINDOW, default=options.get(CONF_PRESENCE_WINDOW, PRESENCE_WINDOW)): vol.All(
+                vol.Coerce(int), vol.Range(min=0, max=3600)
+            ),
+            vol.Optional(CONF_PRESENCE_WATCHED, default=options.get(CONF_PRESENCE_WATCHED, "")): str,
+            vol.Optional(CONF_ENGINE_PORT, default=options.get(CONF_ENGINE_PORT, 0)): vol.All(
+                vol.Coerce(int), vol.Range(min=0, max=65535)
+            ),
+        })
+
+        return self.async_show_form(step_id="init", data_schema=data_schema, errors=errors)
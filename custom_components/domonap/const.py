@@ -6,22 +6,106 @@ import voluptuous as vol
 
 
 DOMAIN = 'domonap'
+HUB = "domonap_hub"
 API = "api"
+TRACER = "tracer"
+KEYS = "keys"
+SETUP_TIMINGS = "setup_timings"
+CALL_SCHEDULER = "call_scheduler"
+CALLS = "calls"
+MESSAGES = "messages"
+PRESENCE = "presence"
+PREVIEWS = "previews"
+KEYS_STORAGE_VERSION = 1
+KEYS_REFRESH_INTERVAL = timedelta(minutes=15)
+SIGNAL_KEY_UPDATED = "domonap_key_updated_{}"
 CONF_COUNTRY_CODE = "country_code"
 CONF_PHONE_NUMBER = "phone_number"
 CONF_CONFIRM_CODE = "confirm_code"
+CONF_HEDGE_OPEN = "hedge_open_relay"
+CONF_CALL_HOLD_TIME = "call_hold_time"
+CONF_CALL_HOLD_OVERRIDES = "call_hold_overrides"
+CONF_PRESENCE_WINDOW = "presence_window"
+CONF_PRESENCE_WATCHED = "presence_watched_users"
+CONF_ENGINE_PORT = "engine_port"
 
 PARAM_ACCESS_TOKEN = "access_token"
 PARAM_REFRESH_TOKEN = "refresh_token"
 PARAM_REFRESH_EXPIRATION = "refresh_expiration_date"
 EVENT_INCOMING_CALL = "domonap_incoming_call"
+EVENT_CALL_ENDED = "domonap_call_ended"
+EVENT_CALL_STATE_CHANGED = "domonap_call_state_changed"
+EVENT_USER_STATUS_CHANGED = "domonap_user_status_changed"
+EVENT_RECEIVE_MESSAGE = "domonap_receive_message"
+# Виды нормализованных событий обработчика уведомлений (events.py, engine.py)
+EVENT_KIND_CALL = "call"
+EVENT_KIND_CALL_ENDED = "call_ended"
+EVENT_KIND_MESSAGE = "message"
+EVENT_KIND_READ = "read"
+EVENT_KIND_PRESENCE = "presence"
+EVENT_KIND_TOKENS = "tokens"
+EVENT_KIND_STATUS = "status"
+EVENT_KIND_REFRESH = "refresh"
+SIGNAL_CALL_STATE = "domonap_call_state_{}"
+SIGNAL_MESSAGES = "domonap_messages_{}"
+SIGNAL_NEW_CHANNEL = "domonap_new_channel_{}"
+SIGNAL_CHANNEL_REMOVED = "domonap_channel_removed_{}"
+# EventMessage пушей, означающих завершение вызова
+CALL_END_EVENT_MESSAGES = ("DomofonCallEnded", "DomofonCallCanceled")
+
+SERVICE_OPEN_DOORS = "open_doors"
+ATTR_KEYS = "keys"
+ATTR_MAX_PARALLEL = "max_parallel"
+OPEN_DOORS_MAX_PARALLEL = 3
+SERVICE_ANSWER_CALL = "answer_call"
+SERVICE_END_CALL = "end_call"
+ATTR_CALL_ID = "call_id"
+ATTR_DOOR_ID = "door_id"
+SERVICE_GET_CALL_HISTORY = "get_call_history"
+ATTR_SINCE = "since"
+ATTR_LIMIT = "limit"
 
 PLATFORMS: list[Platform] = [Platform.BUTTON, Platform.CAMERA, Platform.BINARY_SENSOR, Platform.SENSOR, Platform.IMAGE]
 
+# Диагностические сенсоры задержек (по умолчанию отключены)
+LATENCY_SENSOR_ENDPOINTS = {
+    "open_relay_latency": "/client-api/Device/OpenRelayByKeyId",
+    "negotiate_latency": "/notificationHub/negotiate",
+    "refresh_token_latency": "/sso-api/Authorization/RefreshToken",
+}
+
 UPDATE_INTERVAL = timedelta(hours=24)
 RESET_DELAY = 10 # секунды
+CALL_MAX_DURATION = 180 # секунды, отвеченный вызов без сигнала о завершении
+CALL_HISTORY_SIZE = 50 # вызовов на дверь
+CALL_HISTORY_ATTR_SIZE = 10 # вызовов в атрибутах сенсора
+MESSAGES_PER_CHANNEL = 50
+MESSAGE_CHANNELS = 200
+HUB_HTTP_CONNECTIONS = 30 # общий пул HTTP-соединений всех аккаунтов
+HUB_CONNECT_SPACING = 0.5 # секунды между подключениями разных аккаунтов
+HUB_CONNECT_JITTER = 0.5
+HUB_RESTART_DELAY = 30 # секунды, перезапуск упавшего обработчика уведомлений
+PREVIEW_CACHE_SIZE = 64
+PREVIEW_SHARE_WINDOW = 5 # секунды, превью отдаётся из памяти без запроса
+PREVIEW_ACTIVE_INTERVAL = 15 # секунды, обновление превью после недавнего звонка
+PREVIEW_ACTIVE_WINDOW = 300 # секунды после звонка, пока дверь считается активной
+PREVIEW_IDLE_INTERVAL = 900 # секунды, обновление превью в покое
+PREVIEW_IDLE_MAX = 3600 # предел, до которого растёт интервал, пока картинка не меняется
+ENGINE_HOST = "127.0.0.1" # воркеры внешнего движка подключаются только локально
+ENGINE_DEFAULT_PORT = 8766
+ENGINE_QUEUE_SIZE = 5000 # событий в очереди воркера, пока HA недоступен
+ENGINE_STATUS_INTERVAL = 30 # секунды
+ENGINE_RESTART_DELAY = 5 # секунды, перезапуск упавшего воркера
+ENGINE_TRACE_FIELD = "_engine_trace" # этапы трассировки звонка из воркера, в событие не попадают
+ENGINE_AUTH_TIMEOUT = 10 # секунды на рукопожатие воркера
+ENGINE_STORAGE_KEY = "domonap.engine" # общий секрет HA и воркеров в .storage
+ENGINE_STORAGE_VERSION = 1
+PRESENCE_WINDOW = 30 # секунды, смена статуса короче окна не публикуется
 
 WS_MESSAGE_END = "\x1e"
 WS_HANDSHAKE_MESSAGE = '{"protocol":"json","version":1}' + WS_MESSAGE_END
 WS_URL = "wss://api.domonap.ru/notificationHub/?id="
+WS_FALLBACK_AFTER = 2 # неудачных подключений WebSocket до перехода на SSE / long polling
+TRANSPORT_UPGRADE_INTERVAL = 600 # секунды, попытка вернуться на WebSocket
+TRANSPORT_PROBE_TIMEOUT = 15
 PHOTO_URL = "https://s3-api.domonap.ru/snapshot/"
\ No newline at end of file
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import (
+    DOMAIN,
+    API,
+    HUB,
+    CALLS,
+    KEYS,
+    MESSAGES,
+    PRESENCE,
+    PREVIEWS,
+    SETUP_TIMINGS,
+    TRACER,
+    PARAM_ACCESS_TOKEN,
+    PARAM_REFRESH_TOKEN,
+)
+
+TO_REDACT = {PARAM_ACCESS_TOKEN, PARAM_REFRESH_TOKEN}
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> dict[str, Any]:
+    stored = hass.data.get(DOMAIN, {}).get(entry.entry_id, {})
+    api = stored.get(API)
+
+    data: dict[str, Any] = {
+        "entry": async_redact_data(dict(entry.data), TO_REDACT),
+        "options": dict(entry.options),
+    }
+    if api is not None:
+        data["endpoints"] = {path: stats.as_dict() for path, stats in api.endpoint_stats.items()}
+        data["hedge"] = dict(api.hedge_stats)
+    if (timings := stored.get(SETUP_TIMINGS)) is not None:
+        data["setup_timings"] = dict(timings)
+    if (keys := stored.get(KEYS)) is not None:
+        data["keys"] = {"count": len(keys.keys), "from_snapshot": keys.from_snapshot}
+    if (calls := stored.get(CALLS)) is not None:
+        data["calls"] = calls.as_dict()
+    if (messages := stored.get(MESSAGES)) is not None:
+        data["message_channels"] = messages.as_dict()
+    if (presence := stored.get(PRESENCE)) is not None:
+        data["presence"] = presence.as_dict()
+    if (previews := stored.get(PREVIEWS)) is not None:
+        data["previews"] = previews.as_dict()
+    if (hub := hass.data.get(HUB)) is not None:
+        data["hub"] = hub.health(entry.entry_id)
+    if (tracer := stored.get(TRACER)) is not None:
+        data["call_traces"] = tracer.as_dict()
+    return data
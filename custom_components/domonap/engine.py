@@ -0,0 +1,436 @@
+"""Headless notification engine for many Domonap accounts.
+
+Runs the account connections outside Home Assistant. The supervisor reads
+the domonap config entries that have an engine port set, shards them across
+worker processes (an account always lands on the same worker), restarts
+workers that die, and each worker forwards normalized events to HA over a
+loopback socket authenticated with the key HA keeps in .storage:
+
+    python -m custom_components.domonap.engine --ha-config /config --workers 4
+
+Run it from the directory holding custom_components, with the same Python
+environment as Home Assistant (the package imports homeassistant), but no
+running HA instance is needed inside the workers.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hmac
+import json
+import logging
+import multiprocessing
+import os
+import secrets
+import signal
+import time
+import zlib
+from collections import deque
+from typing import Any, Callable, Optional
+
+import aiohttp
+
+from .api import IntercomAPI
+from .const import (
+    CONF_ENGINE_PORT,
+    DOMAIN,
+    ENGINE_DEFAULT_PORT,
+    ENGINE_HOST,
+    ENGINE_QUEUE_SIZE,
+    ENGINE_AUTH_TIMEOUT,
+    ENGINE_RESTART_DELAY,
+    ENGINE_STATUS_INTERVAL,
+    ENGINE_STORAGE_KEY,
+    ENGINE_TRACE_FIELD,
+    EVENT_KIND_CALL,
+    EVENT_KIND_REFRESH,
+    EVENT_KIND_STATUS,
+    EVENT_KIND_TOKENS,
+    PARAM_ACCESS_TOKEN,
+    PARAM_REFRESH_EXPIRATION,
+    PARAM_REFRESH_TOKEN,
+    UPDATE_INTERVAL,
+)
+from .hub import ConnectGate, engine_proof
+from .notify_consumer import IntercomNotifyConsumer
+
+_LOGGER = logging.getLogger(__name__)
+
+LATEST_ONLY_KINDS = (EVENT_KIND_TOKENS, EVENT_KIND_STATUS)
+
+
+class EngineForwarder:
+    """Connection from one worker to HA.
+
+    Both sides prove they know the engine key before anything else is sent,
+    then the worker is bound to its accounts. Outgoing events wait in a
+    bounded queue while HA is unreachable (the oldest are dropped), except
+    kinds where only the latest value matters: those keep one slot per
+    account and are never dropped. Incoming lines are handed to on_message.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        key: str,
+        accounts: list[str],
+        on_message: Callable[[dict[str, Any]], None],
+    ) -> None:
+        self._host = host
+        self._port = port
+        self._key = key
+        self._accounts = accounts
+        self._on_message = on_message
+        self._queue: deque[bytes] = deque(maxlen=ENGINE_QUEUE_SIZE)
+        self._latest: dict[tuple[str, str], bytes] = {}
+        self._wakeup = asyncio.Event()
+        self.connected = False
+        self.dropped = 0
+
+    def send(self, account: str, kind: str, data: dict[str, Any]) -> None:
+        line = json.dumps({"account": account, "kind": kind, "data": data}).encode() + b"\n"
+        if kind in LATEST_ONLY_KINDS:
+            # Токены и статус не вытесняются из очереди, новое значение заменяет старое
+            self._latest[(account, kind)] = line
+        else:
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1
+            self._queue.append(line)
+        self._wakeup.set()
+
+    async def run(self) -> None:
+        delay = 1
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(self._host, self._port)
+            except OSError as err:
+                _LOGGER.debug("HA is not reachable on %s:%s: %s", self._host, self._port, err)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+                continue
+            try:
+                authenticated = await self._handshake(reader, writer)
+            except (ConnectionError, OSError, asyncio.TimeoutError, ValueError, KeyError, TypeError) as err:
+                _LOGGER.debug("Handshake with HA failed: %s", err)
+                authenticated = False
+            if not authenticated:
+                _LOGGER.error("HA on %s:%s did not accept the engine key", self._host, self._port)
+                writer.close()
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+                continue
+            delay = 1
+            self.connected = True
+            _LOGGER.info("Connected to HA on %s:%s", self._host, self._port)
+            reader_task = asyncio.create_task(self._read(reader))
+            try:
+                await self._write(writer, reader_task)
+            except (ConnectionError, OSError) as err:
+                _LOGGER.info("Connection to HA lost: %s", err)
+            finally:
+                self.connected = False
+                reader_task.cancel()
+                writer.close()
+            await asyncio.sleep(delay)
+
+    async def _handshake(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> bool:
+        nonce = secrets.token_hex(16)
+        writer.write(json.dumps({"hello": nonce, "accounts": self._accounts}).encode() + b"\n")
+        await writer.drain()
+        challenge = json.loads(await asyncio.wait_for(reader.readline(), ENGINE_AUTH_TIMEOUT))
+        # Ключ не уходит тому, кто не доказал, что тоже его знает
+        if not hmac.compare_digest(str(challenge["proof"]), engine_proof(self._key, "hub", nonce)):
+            return False
+        writer.write(json.dumps({"auth": engine_proof(self._key, "worker", str(challenge["nonce"]))}).encode() + b"\n")
+        await writer.drain()
+        return True
+
+    async def _write(self, writer: asyncio.StreamWriter, reader_task: asyncio.Task) -> None:
+        while not reader_task.done():
+            while self._latest:
+                slot, line = next(iter(self._latest.items()))
+                del self._latest[slot]
+                try:
+                    writer.write(line)
+                    await writer.drain()
+                except BaseException:
+                    # Возвращаем, если за время отправки не появилось значение новее
+                    self._latest.setdefault(slot, line)
+                    raise
+            while self._queue and not self._latest:
+                # Строка снимается до отправки: пока идёт drain, send() может вытеснить голову очереди
+                line = self._queue.popleft()
+                try:
+                    writer.write(line)
+                    await writer.drain()
+                except BaseException:
+                    if len(self._queue) < ENGINE_QUEUE_SIZE:
+                        self._queue.appendleft(line)
+                    raise
+            if self._latest:
+                continue
+            self._wakeup.clear()
+            waiter = asyncio.create_task(self._wakeup.wait())
+            await asyncio.wait((waiter, reader_task), return_when=asyncio.FIRST_COMPLETED)
+            waiter.cancel()
+
+    async def _read(self, reader: asyncio.StreamReader) -> None:
+        while line := await reader.readline():
+            try:
+                self._on_message(json.loads(line))
+            except (ValueError, KeyError, TypeError):
+                _LOGGER.debug("Invalid line from HA: %s", line[:200])
+
+
+def _ws_url(base_url: str) -> str:
+    return base_url.rstrip("/").replace("http", "ws", 1) + "/notificationHub/?id="
+
+
+async def run_worker(
+    accounts: list[dict[str, Any]], host: str, port: int, key: str, base_url: Optional[str] = None
+) -> None:
+    # Воркер - единственный, кто обновляет токены своих аккаунтов, HA только хранит их
+    apis: dict[str, IntercomAPI] = {}
+    refreshing: dict[str, asyncio.Task] = {}
+
+    def refresh(account_id: str) -> None:
+        task = refreshing.get(account_id)
+        if task is None or task.done():
+            refreshing[account_id] = asyncio.create_task(apis[account_id].update_token())
+
+    def on_message(msg: dict[str, Any]) -> None:
+        account_id = msg["account"]
+        if account_id not in apis:
+            return
+        if msg["kind"] == EVENT_KIND_TOKENS:
+            data = msg["data"]
+            # После простоя HA присылает сохранённые токены, они могут быть старше уже обновлённых здесь
+            apis[account_id].set_tokens_if_newer(
+                data["access_token"], data["refresh_token"], data["refresh_expiration_date"]
+            )
+        elif msg["kind"] == EVENT_KIND_REFRESH:
+            refresh(account_id)
+
+    forwarder = EngineForwarder(host, port, key, [account["id"] for account in accounts], on_message)
+    gate = ConnectGate()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    async with aiohttp.ClientSession() as session:
+        consumers: dict[str, IntercomNotifyConsumer] = {}
+        for account in accounts:
+            account_id = account["id"]
+            api = IntercomAPI(base_url=base_url, session=session) if base_url else IntercomAPI(session=session)
+            api.set_tokens(account["access_token"], account["refresh_token"], account["refresh_expiration_date"])
+
+            def _tokens(access: str, refresh: str, expiration: str, account_id: str = account_id) -> None:
+                # HA - хранитель токенов: сохраняет их в записи интеграции
+                forwarder.send(
+                    account_id,
+                    EVENT_KIND_TOKENS,
+                    {"access_token": access, "refresh_token": refresh, "refresh_expiration_date": expiration},
+                )
+
+            api.token_update_callback = _tokens
+            apis[account_id] = api
+
+            def _forward(kind: str, data: dict[str, Any], account_id: str = account_id) -> None:
+                trace = consumers[account_id].tracer.get(str(data.get("CallId", ""))) if kind == EVENT_KIND_CALL else None
+                if trace is not None:
+                    # Этапы в часах системы: HA пересчитает их в свои монотонные часы
+                    offset = time.time() - time.monotonic()
+                    data = {**data, ENGINE_TRACE_FIELD: {stage: ts + offset for stage, ts in trace.stages.items()}}
+                forwarder.send(account_id, kind, data)
+
+            consumers[account_id] = IntercomNotifyConsumer(
+                None,
+                api,
+                session=session,
+                sink=_forward,
+                connect_gate=gate,
+                **({"ws_url": _ws_url(base_url)} if base_url else {}),
+            )
+
+        async def report_status() -> None:
+            while True:
+                await asyncio.sleep(ENGINE_STATUS_INTERVAL)
+                for account_id, consumer in consumers.items():
+                    forwarder.send(
+                        account_id,
+                        EVENT_KIND_STATUS,
+                        {
+                            "connected": consumer.connected,
+                            "transport": consumer.transport,
+                            "last_error": consumer.last_error,
+                            "pid": os.getpid(),
+                            "dropped": forwarder.dropped,
+                            **consumer.stats,
+                        },
+                    )
+
+        async def refresh_tokens() -> None:
+            while True:
+                await asyncio.sleep(UPDATE_INTERVAL.total_seconds())
+                for account_id in apis:
+                    refresh(account_id)
+
+        tasks = [
+            asyncio.create_task(forwarder.run()),
+            asyncio.create_task(report_status()),
+            asyncio.create_task(refresh_tokens()),
+        ]
+        tasks += [asyncio.create_task(consumer.start()) for consumer in consumers.values()]
+        _LOGGER.info("Worker %s serves %s account(s)", os.getpid(), len(consumers))
+        await stop.wait()
+
+        for consumer in consumers.values():
+            await consumer.stop()
+        tasks += refreshing.values()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for api in apis.values():
+            await api.close()
+
+
+def _worker_main(
+    accounts: list[dict[str, Any]], host: str, port: int, key: str, base_url: Optional[str], log_level: str
+) -> None:
+    logging.basicConfig(level=log_level, format=f"%(asctime)s %(levelname)s [worker {os.getpid()}] %(message)s")
+    asyncio.run(run_worker(accounts, host, port, key, base_url))
+
+
+def load_engine_key(ha_config: str) -> Optional[str]:
+    """Key HA created when the first account got an engine port."""
+    try:
+        with open(os.path.join(ha_config, ".storage", ENGINE_STORAGE_KEY), encoding="utf-8") as f:
+            return json.load(f)["data"]["key"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def load_accounts(ha_config: str) -> tuple[list[dict[str, Any]], Optional[int]]:
+    """Domonap config entries with an engine port, and that port."""
+    with open(os.path.join(ha_config, ".storage", "core.config_entries"), encoding="utf-8") as f:
+        entries = json.load(f)["data"]["entries"]
+    accounts = []
+    ports = set()
+    for entry in entries:
+        port = (entry.get("options") or {}).get(CONF_ENGINE_PORT)
+        if entry.get("domain") != DOMAIN or entry.get("disabled_by") or not port:
+            continue
+        ports.add(port)
+        data = entry["data"]
+        accounts.append(
+            {
+                "id": entry["entry_id"],
+                "access_token": data.get(PARAM_ACCESS_TOKEN),
+                "refresh_token": data.get(PARAM_REFRESH_TOKEN),
+                "refresh_expiration_date": data.get(PARAM_REFRESH_EXPIRATION),
+            }
+        )
+    if len(ports) > 1:
+        _LOGGER.warning("Entries use different engine ports %s, HA listens only on the first one", sorted(ports))
+    return accounts, min(ports) if ports else None
+
+
+def shard(accounts: list[dict[str, Any]], workers: int) -> list[list[dict[str, Any]]]:
+    # Стабильный хэш: при перезапуске аккаунт попадает в тот же воркер
+    shards: list[list[dict[str, Any]]] = [[] for _ in range(workers)]
+    for account in accounts:
+        shards[zlib.crc32(account["id"].encode()) % workers].append(account)
+    return shards
+
+
+def supervise(
+    ha_config: str,
+    shards: list[list[dict[str, Any]]],
+    host: str,
+    port: int,
+    key: str,
+    base_url: Optional[str],
+    log_level: str,
+) -> None:
+    ctx = multiprocessing.get_context("spawn")
+    procs: dict[int, Any] = {}
+    restart_at: dict[int, float] = {}
+    stopping = False
+
+    def _stop(*_args: Any) -> None:
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    def _start(index: int) -> None:
+        proc = ctx.Process(
+            target=_worker_main, args=(shards[index], host, port, key, base_url, log_level), name=f"domonap-engine-{index}"
+        )
+        proc.start()
+        procs[index] = proc
+        _LOGGER.info("Worker %s (pid %s): %s account(s)", index, proc.pid, len(shards[index]))
+
+    for index, accounts in enumerate(shards):
+        if accounts:
+            _start(index)
+
+    while True:
+        time.sleep(1)
+        if stopping:
+            # Воркеры получают тот же сигнал и завершаются сами
+            break
+        now = time.monotonic()
+        for index, proc in list(procs.items()):
+            if proc.is_alive():
+                continue
+            if index not in restart_at:
+                _LOGGER.warning("Worker %s exited with code %s, restarting", index, proc.exitcode)
+                restart_at[index] = now + ENGINE_RESTART_DELAY
+            elif now >= restart_at[index]:
+                del restart_at[index]
+                # После обновления токенов в .storage старые из памяти уже недействительны
+                try:
+                    shards[index] = shard(load_accounts(ha_config)[0], len(shards))[index]
+                except (OSError, ValueError, KeyError) as err:
+                    _LOGGER.warning("Failed to re-read accounts, restarting worker %s with old tokens: %s", index, err)
+                if shards[index]:
+                    _start(index)
+                else:
+                    del procs[index]
+
+    for proc in procs.values():
+        if proc.is_alive():
+            proc.terminate()
+    for proc in procs.values():
+        proc.join(10)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Domonap headless notification engine")
+    parser.add_argument("--ha-config", default="/config", help="Home Assistant config directory")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--host", default=ENGINE_HOST, help="address HA listens on")
+    parser.add_argument("--port", type=int, help="port HA listens on (default: from the config entries)")
+    parser.add_argument("--base-url", help="Domonap API URL, e.g. a test server (default: production)")
+    parser.add_argument("--log-level", default="INFO")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level, format="%(asctime)s %(levelname)s [supervisor] %(message)s")
+
+    accounts, entry_port = load_accounts(args.ha_config)
+    if not accounts:
+        parser.error(f"no {DOMAIN} config entries with {CONF_ENGINE_PORT} set in {args.ha_config}")
+    key = load_engine_key(args.ha_config)
+    if key is None:
+        parser.error(f"no engine key in {args.ha_config}/.storage, start HA with {CONF_ENGINE_PORT} set first")
+    port = args.port or entry_port or ENGINE_DEFAULT_PORT
+    workers = max(1, min(args.workers, len(accounts)))
+    _LOGGER.info("%s account(s) on %s worker(s), HA at %s:%s", len(accounts), workers, args.host, port)
+    supervise(args.ha_config, shard(accounts, workers), args.host, port, key, args.base_url, args.log_level)
+
+
+if __name__ == "__main__":
+    main()
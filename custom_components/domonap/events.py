@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import logging
+import time
+from typing import TYPE_CHECKING, Any, Callable, Optional
+
+from homeassistant.core import HomeAssistant, callback
+
+from .const import (
+    EVENT_INCOMING_CALL,
+    EVENT_CALL_ENDED,
+    EVENT_RECEIVE_MESSAGE,
+    EVENT_USER_STATUS_CHANGED,
+    EVENT_KIND_CALL,
+    EVENT_KIND_CALL_ENDED,
+    EVENT_KIND_MESSAGE,
+    EVENT_KIND_READ,
+    EVENT_KIND_PRESENCE,
+    EVENT_KIND_TOKENS,
+    ENGINE_TRACE_FIELD,
+)
+from .tracing import STAGE_BUS_FIRED, STAGE_RECEIVED, CallTracer
+
+if TYPE_CHECKING:
+    from .calls import CallRegistry
+    from .messages import MessageStore
+    from .presence import PresenceTable
+
+_LOGGER = logging.getLogger(__name__)
+
+# Получатель нормализованных событий обработчика уведомлений: (вид события, данные)
+EventSink = Callable[[str, dict[str, Any]], None]
+
+
+class EntryEventSink:
+    """Delivers normalized notify events of one account into HA.
+
+    Used directly by an in-process IntercomNotifyConsumer and by the hub for
+    events forwarded by an external engine, so both paths fire the same bus
+    events and update the same call, chat and presence state. For forwarded
+    calls it also continues the worker's call trace in tracer.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        *,
+        calls: Optional[CallRegistry] = None,
+        messages: Optional[MessageStore] = None,
+        presence: Optional[PresenceTable] = None,
+        on_tokens: Optional[Callable[[str, str, str], None]] = None,
+        tracer: Optional[CallTracer] = None,
+    ) -> None:
+        self._hass = hass
+        self._calls = calls
+        self._messages = messages
+        self._presence = presence
+        self._on_tokens = on_tokens
+        self._tracer = tracer
+
+    @callback
+    def __call__(self, kind: str, data: dict[str, Any]) -> None:
+        if kind == EVENT_KIND_CALL:
+            stages = data.pop(ENGINE_TRACE_FIELD, None)
+            call_id = str(data.get("CallId", ""))
+            if self._tracer is not None and isinstance(stages, dict) and STAGE_RECEIVED in stages:
+                # Воркер передаёт время этапов по часам системы, они общие для процессов одной машины
+                offset = time.monotonic() - time.time()
+                trace = self._tracer.start(call_id, data.get("DoorId"), stages[STAGE_RECEIVED] + offset)
+                for stage, ts in stages.items():
+                    trace.stages.setdefault(stage, ts + offset)
+            self._hass.bus.async_fire(EVENT_INCOMING_CALL, data)
+            if self._tracer is not None:
+                self._tracer.mark(call_id, STAGE_BUS_FIRED)
+            if self._calls is not None:
+                self._calls.ringing(data)
+        elif kind == EVENT_KIND_CALL_ENDED:
+            self._hass.bus.async_fire(EVENT_CALL_ENDED, data)
+            if self._calls is not None:
+                self._calls.remote_ended(data)
+        elif kind == EVENT_KIND_MESSAGE:
+            chat_data = data.get("message")
+            self._hass.bus.async_fire(EVENT_RECEIVE_MESSAGE, chat_data)
+            if self._messages is not None and isinstance(chat_data, dict):
+                self._messages.add(chat_data, data.get("username") or "")
+        elif kind == EVENT_KIND_READ:
+            if self._messages is not None:
+                self._messages.mark_read(data.get("channel"))
+        elif kind == EVENT_KIND_PRESENCE:
+            if self._presence is not None:
+                self._presence.report(data.get("user"), data.get("status"))
+            else:
+                self._hass.bus.async_fire(EVENT_USER_STATUS_CHANGED, data)
+        elif kind == EVENT_KIND_TOKENS:
+            if self._on_tokens is not None:
+                self._on_tokens(data["access_token"], data["refresh_token"], data["refresh_expiration_date"])
+        else:
+            _LOGGER.debug("Unknown event kind %s: %s", kind, data)
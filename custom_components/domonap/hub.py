@@ -0,0 +1,322 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import random
+import secrets
+import time
+from typing import TYPE_CHECKING, Any, Callable, Optional
+
+import aiohttp
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import EVENT_HOMEASSISTANT_CLOSE
+from homeassistant.core import Event, HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+
+from .const import (
+    DOMAIN,
+    ENGINE_AUTH_TIMEOUT,
+    ENGINE_HOST,
+    ENGINE_STORAGE_KEY,
+    ENGINE_STORAGE_VERSION,
+    EVENT_KIND_TOKENS,
+    EVENT_KIND_STATUS,
+    HUB,
+    HUB_CONNECT_JITTER,
+    HUB_CONNECT_SPACING,
+    HUB_HTTP_CONNECTIONS,
+    HUB_RESTART_DELAY,
+)
+
+if TYPE_CHECKING:
+    from .events import EventSink
+    from .notify_consumer import IntercomNotifyConsumer
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@callback
+def async_get_hub(hass: HomeAssistant) -> "DomonapHub":
+    hub = hass.data.get(HUB)
+    if hub is None:
+        hub = hass.data[HUB] = DomonapHub(hass)
+    return hub
+
+
+def engine_proof(key: str, role: str, nonce: str) -> str:
+    """Proof that the side named role knows the engine key, for the peer's nonce."""
+    return hmac.new(key.encode(), f"{role}:{nonce}".encode(), hashlib.sha256).hexdigest()
+
+
+class ConnectGate:
+    """Hands out connection slots at least spacing seconds apart.
+
+    Works without Home Assistant, so engine workers use it as well.
+    """
+
+    def __init__(self, spacing: float = HUB_CONNECT_SPACING, jitter: float = HUB_CONNECT_JITTER) -> None:
+        self._spacing = spacing
+        self._jitter = jitter
+        self._next_slot = 0.0
+        self.waiting = 0
+
+    async def __call__(self) -> None:
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self._spacing
+        delay = slot - now
+        if delay <= 0:
+            return
+        delay += random.uniform(0, self._jitter)
+        self.waiting += 1
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            self.waiting -= 1
+
+
+class DomonapHub:
+    """State shared by all Domonap accounts of one HA instance.
+
+    Owns one pooled HTTP session for every IntercomAPI and supervises the
+    notification consumers. Connection attempts of all accounts go through a
+    single gate that hands out slots HUB_CONNECT_SPACING apart, so a backend
+    blip does not turn into every account negotiating at the same moment.
+    Accounts served by an external engine (engine.py) get their events over
+    a loopback socket instead of a local consumer. A worker has to prove it
+    knows the key kept in .storage and is then bound to the accounts it
+    reported: only it gets their tokens and only its events for them count.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self._hass = hass
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._unsub_close: Optional[Callable[[], None]] = None
+        self._entries: set[str] = set()
+        self._consumers: dict[str, IntercomNotifyConsumer] = {}
+        self._restarts: dict[str, int] = {}
+        self.connect_gate = ConnectGate()
+        self._remote: dict[str, EventSink] = {}
+        self._remote_tokens: dict[str, Callable[[], dict[str, Any]]] = {}
+        self._remote_status: dict[str, dict[str, Any]] = {}
+        self._engine_server: Optional[asyncio.AbstractServer] = None
+        self._engine_port: Optional[int] = None
+        self._engine_key: Optional[str] = None
+        self._engine_writers: set[asyncio.StreamWriter] = set()
+        # Аккаунт -> соединение воркера, который его обслуживает
+        self._engine_accounts: dict[str, asyncio.StreamWriter] = {}
+        self._engine_stats = {"received": 0, "unknown_account": 0, "invalid": 0, "rejected": 0}
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=HUB_HTTP_CONNECTIONS, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(connector=connector)
+            if self._unsub_close is None:
+                self._unsub_close = self._hass.bus.async_listen_once(
+                    EVENT_HOMEASSISTANT_CLOSE, self._async_close_session
+                )
+        return self._session
+
+    async def _async_close_session(self, _event: Event) -> None:
+        # HA останавливается без выгрузки записей: закрываем пул сами
+        self._unsub_close = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @callback
+    def acquire(self, entry_id: str) -> aiohttp.ClientSession:
+        self._entries.add(entry_id)
+        return self.session
+
+    async def async_release(self, entry_id: str) -> None:
+        self._entries.discard(entry_id)
+        self._consumers.pop(entry_id, None)
+        self._restarts.pop(entry_id, None)
+        self._remote.pop(entry_id, None)
+        self._remote_tokens.pop(entry_id, None)
+        self._remote_status.pop(entry_id, None)
+        if not self._remote and self._engine_server is not None:
+            await self._async_stop_engine_server()
+        if not self._entries and self._session is not None:
+            # Последний аккаунт выгружен: пул соединений больше не нужен
+            if self._unsub_close is not None:
+                self._unsub_close()
+                self._unsub_close = None
+            await self._session.close()
+            self._session = None
+
+    async def _async_load_engine_key(self) -> str:
+        store: Store[dict[str, Any]] = Store(
+            self._hass, ENGINE_STORAGE_VERSION, ENGINE_STORAGE_KEY, private=True
+        )
+        data = await store.async_load()
+        if not data or not data.get("key"):
+            data = {"key": secrets.token_hex(32)}
+            await store.async_save(data)
+        return data["key"]
+
+    async def async_add_remote(
+        self, entry_id: str, sink: EventSink, port: int, tokens: Callable[[], dict[str, Any]]
+    ) -> None:
+        """Routes events of an account served by an external engine to sink.
+
+        tokens returns the current tokens of the account, they are sent to a
+        worker as soon as it takes the account over.
+        """
+        if self._engine_server is None:
+            if self._engine_key is None:
+                self._engine_key = await self._async_load_engine_key()
+            self._engine_server = await asyncio.start_server(self._handle_engine, ENGINE_HOST, port)
+            self._engine_port = port
+            _LOGGER.info("Waiting for Domonap engine workers on %s:%s", ENGINE_HOST, port)
+        elif port != self._engine_port:
+            _LOGGER.warning(
+                "Engine port %s of %s ignored, engine workers connect to port %s", port, entry_id, self._engine_port
+            )
+        self._remote[entry_id] = sink
+        self._remote_tokens[entry_id] = tokens
+
+    @callback
+    def async_send_remote(self, entry_id: str, kind: str, data: dict[str, Any]) -> None:
+        """Sends an event (e.g. refreshed tokens) to the engine worker serving entry_id."""
+        writer = self._engine_accounts.get(entry_id)
+        if writer is not None and not writer.is_closing():
+            writer.write(json.dumps({"account": entry_id, "kind": kind, "data": data}).encode() + b"\n")
+
+    async def _engine_handshake(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> Optional[list[str]]:
+        """Mutual challenge-response on the engine key, returns the worker's accounts."""
+        try:
+            hello = json.loads(await asyncio.wait_for(reader.readline(), ENGINE_AUTH_TIMEOUT))
+            worker_nonce, accounts = hello["hello"], hello["accounts"]
+            nonce = secrets.token_hex(16)
+            writer.write(
+                json.dumps({"nonce": nonce, "proof": engine_proof(self._engine_key, "hub", str(worker_nonce))}).encode()
+                + b"\n"
+            )
+            await writer.drain()
+            reply = json.loads(await asyncio.wait_for(reader.readline(), ENGINE_AUTH_TIMEOUT))
+            proof = reply["auth"]
+        except (asyncio.TimeoutError, ValueError, KeyError, TypeError):
+            return None
+        if not isinstance(proof, str) or not hmac.compare_digest(
+            proof, engine_proof(self._engine_key, "worker", nonce)
+        ):
+            return None
+        return [account for account in accounts if isinstance(account, str)]
+
+    async def _handle_engine(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        peer = writer.get_extra_info("peername")
+        try:
+            accounts = await self._engine_handshake(reader, writer)
+        except ConnectionError:
+            accounts = None
+        if accounts is None:
+            self._engine_stats["rejected"] += 1
+            _LOGGER.warning("Rejected engine connection from %s: authentication failed", peer)
+            writer.close()
+            return
+        _LOGGER.debug("Engine worker %s serves %s", peer, accounts)
+        self._engine_writers.add(writer)
+        for entry_id in accounts:
+            # Перезапущенный воркер забирает аккаунт у старого соединения
+            self._engine_accounts[entry_id] = writer
+            if (tokens := self._remote_tokens.get(entry_id)) is not None:
+                # Токены у воркера могли устареть, пока он был остановлен
+                self.async_send_remote(entry_id, EVENT_KIND_TOKENS, tokens())
+        try:
+            while line := await reader.readline():
+                self._engine_stats["received"] += 1
+                try:
+                    msg = json.loads(line)
+                    entry_id, kind, data = msg["account"], msg["kind"], msg.get("data") or {}
+                except (ValueError, KeyError, TypeError):
+                    self._engine_stats["invalid"] += 1
+                    continue
+                sink = self._remote.get(entry_id)
+                if sink is None or self._engine_accounts.get(entry_id) is not writer:
+                    self._engine_stats["unknown_account"] += 1
+                    continue
+                if kind == EVENT_KIND_STATUS:
+                    self._remote_status[entry_id] = data
+                    continue
+                try:
+                    sink(kind, data)
+                except Exception:
+                    _LOGGER.exception("Failed to handle %s event of %s", kind, entry_id)
+        except (ConnectionError, ValueError) as err:
+            _LOGGER.debug("Engine worker %s dropped: %s", peer, err)
+        finally:
+            self._engine_writers.discard(writer)
+            for entry_id in [e for e, w in self._engine_accounts.items() if w is writer]:
+                del self._engine_accounts[entry_id]
+            writer.close()
+        _LOGGER.debug("Engine worker %s disconnected", peer)
+
+    async def _async_stop_engine_server(self) -> None:
+        self._engine_server.close()
+        for writer in list(self._engine_writers):
+            writer.close()
+        await self._engine_server.wait_closed()
+        self._engine_server = None
+        self._engine_port = None
+        self._engine_accounts.clear()
+
+    @callback
+    def async_start_consumer(self, entry: ConfigEntry, consumer: IntercomNotifyConsumer) -> None:
+        self._consumers[entry.entry_id] = consumer
+        self._restarts[entry.entry_id] = 0
+        entry.async_create_background_task(
+            self._hass, self._supervise(entry.entry_id, consumer), f"{DOMAIN}_notify_{entry.entry_id}"
+        )
+
+    async def _supervise(self, entry_id: str, consumer: IntercomNotifyConsumer) -> None:
+        while True:
+            try:
+                # start() возвращается только после stop()
+                await consumer.start()
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                _LOGGER.exception("Notify consumer of %s crashed, restarting", entry_id)
+            if self._consumers.get(entry_id) is not consumer:
+                return
+            self._restarts[entry_id] = self._restarts.get(entry_id, 0) + 1
+            await asyncio.sleep(HUB_RESTART_DELAY)
+
+    def health(self, entry_id: str) -> dict[str, Any]:
+        """Aggregates over all accounts plus the details of entry_id only."""
+        now = time.time()
+        accounts = {}
+        for account_id, consumer in self._consumers.items():
+            accounts[account_id] = {
+                "connected": consumer.connected,
+                "transport": consumer.transport,
+                "uptime_s": round(now - consumer.connected_since) if consumer.connected_since else None,
+                "restarts": self._restarts.get(account_id, 0),
+                "last_error": consumer.last_error,
+                **consumer.stats,
+            }
+        connected = sum(1 for a in accounts.values() if a["connected"])
+        return {
+            "accounts": len(accounts),
+            "connected": connected,
+            "disconnected": len(accounts) - connected,
+            "waiting_to_connect": self.connect_gate.waiting,
+            "http_pool_limit": HUB_HTTP_CONNECTIONS,
+            "account": accounts.get(entry_id),
+            "engine": {
+                "port": self._engine_port,
+                "workers": len(self._engine_writers),
+                "accounts": len(self._remote),
+                "account": self._remote_status.get(entry_id) if entry_id in self._remote else None,
+                **self._engine_stats,
+            },
+        }
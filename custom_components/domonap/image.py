@@ -1,46 +1,67 @@
 from __future__ import annotations
 
 import logging
+import time
 from typing import Optional, Callable
 
 from homeassistant.components.image import ImageEntity
 from homeassistant.core import HomeAssistant, callback
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+from homeassistant.helpers.start import async_at_started
 from homeassistant.util import dt as dt_util
 
-from .const import DOMAIN, API, EVENT_INCOMING_CALL
+from .calls import CallRegistry
+from .const import (
+    DOMAIN,
+    API,
+    TRACER,
+    SETUP_TIMINGS,
+    CALLS,
+    CALL_SCHEDULER,
+    PREVIEWS,
+    PREVIEW_ACTIVE_INTERVAL,
+    PREVIEW_ACTIVE_WINDOW,
+    PREVIEW_IDLE_INTERVAL,
+    PREVIEW_IDLE_MAX,
+    EVENT_INCOMING_CALL,
+    SIGNAL_KEY_UPDATED,
+)
+from .keys import async_setup_key_entities
+from .previews import PreviewCache
+from .scheduler import ExpiryScheduler
+from .tracing import CallTracer, STAGE_PHOTO_DISPLAYED
 
 _LOGGER = logging.getLogger(__name__)
 
 
 async def async_setup_entry(hass: HomeAssistant, config_entry: ConfigEntry, async_add_entities):
-    entities: list[IntercomCallImageEntity] = []
-    api = hass.data[DOMAIN][config_entry.entry_id][API]
+    stored = hass.data[DOMAIN][config_entry.entry_id]
+    api = stored[API]
+    tracer = stored.get(TRACER)
+    timings = stored.get(SETUP_TIMINGS)
 
-    response = await api.get_paged_keys()
-    keys = response.get("results", [])
-
-    for key in keys:
+    def _entities(key) -> list[IntercomCallImageEntity]:
         # создаём сущность только если есть стартовый превью-URL
-        if key.get("videoPreview") is not None:
-            key_id: str = key["id"]
-            door_id: str = key["doorId"]
-            door_name: str = key["name"]
-            photo_url: str = key["videoPreview"]
-
-            entities.append(
-                IntercomCallImageEntity(
-                    hass=hass,
-                    api=api,
-                    key_id=key_id,
-                    door_id=door_id,
-                    device_name=door_name,
-                    photo_url=photo_url,
-                )
+        if key.get("videoPreview") is None:
+            return []
+        return [
+            IntercomCallImageEntity(
+                hass=hass,
+                api=api,
+                key_id=key["id"],
+                door_id=key["doorId"],
+                device_name=key["name"],
+                photo_url=key["videoPreview"],
+                previews=stored[PREVIEWS],
+                calls=stored[CALLS],
+                scheduler=stored[CALL_SCHEDULER],
+                tracer=tracer,
+                setup_timings=timings,
             )
+        ]
 
-    async_add_entities(entities, True)
+    async_setup_key_entities(hass, config_entry, async_add_entities, _entities)
 
 
 class IntercomCallImageEntity(ImageEntity):
@@ -55,7 +76,12 @@ class IntercomCallImageEntity(ImageEntity):
         key_id: str,
         door_id: str,
         device_name: str,
-        photo_url: Optional[str] = None,
+        photo_url: Optional[str],
+        previews: PreviewCache,
+        calls: CallRegistry,
+        scheduler: ExpiryScheduler,
+        tracer: Optional[CallTracer] = None,
+        setup_timings: Optional[dict] = None,
     ):
         super().__init__(hass)
         self._api = api
@@ -64,7 +90,16 @@ class IntercomCallImageEntity(ImageEntity):
         self._device_name = device_name
         self._photo_url = photo_url
         self._image_bytes: Optional[bytes] = None
+        self._digest: Optional[bytes] = None
+        self._previews = previews
+        self._calls = calls
+        self._scheduler = scheduler
+        self._last_activity = 0.0
+        self._idle_interval = PREVIEW_IDLE_INTERVAL
+        self._removed = False
         self._unsub: Optional[Callable[[], None]] = None
+        self._tracer = tracer
+        self._setup_timings = setup_timings
 
     @property
     def unique_id(self) -> str:
@@ -83,13 +118,33 @@ class IntercomCallImageEntity(ImageEntity):
         self._unsub = self.hass.bus.async_listen(
             EVENT_INCOMING_CALL, self._handle_incoming_call
         )
+        self.async_on_remove(
+            async_dispatcher_connect(
+                self.hass, SIGNAL_KEY_UPDATED.format(self._key_id), self._handle_key_update
+            )
+        )
+
+        # Превью скачивается в фоне после старта HA, чтобы не задерживать запуск
+        self.async_on_remove(async_at_started(self.hass, self._schedule_initial_fetch))
 
+    @callback
+    def _schedule_initial_fetch(self, _hass: HomeAssistant) -> None:
         if self._photo_url:
-            data = await self._http_get_bytes(self._photo_url)
-            if data:
-                await self._set_image(data)
+            self.platform.config_entry.async_create_background_task(
+                self.hass, self._initial_fetch(), f"domonap_preview_{self._door_id}"
+            )
+
+    async def _initial_fetch(self) -> None:
+        started = time.monotonic()
+        await self._async_refresh()
+        if self._setup_timings is not None:
+            elapsed = round((time.monotonic() - started) * 1000, 1)
+            self._setup_timings["previews_loaded"] = self._setup_timings.get("previews_loaded", 0) + 1
+            self._setup_timings["previews_max_ms"] = max(self._setup_timings.get("previews_max_ms", 0), elapsed)
 
     async def async_will_remove_from_hass(self) -> None:
+        self._removed = True
+        self._scheduler.cancel(self._refresh_key)
         if self._unsub:
             self._unsub()
             self._unsub = None
@@ -97,6 +152,15 @@ class IntercomCallImageEntity(ImageEntity):
     async def async_image(self) -> bytes | None:
         return self._image_bytes
 
+    @callback
+    def _handle_key_update(self, key) -> None:
+        photo_url: Optional[str] = key.get("videoPreview")
+        if not photo_url or photo_url == self._photo_url:
+            return
+        self._photo_url = photo_url
+        self._idle_interval = PREVIEW_IDLE_INTERVAL
+        self._refresh_due()
+
     @callback
     def _handle_incoming_call(self, event) -> None:
         if event.data.get("DoorId") != self._door_id:
@@ -106,25 +170,67 @@ class IntercomCallImageEntity(ImageEntity):
         if not photo_url:
             return
 
+        call_id: Optional[str] = event.data.get("CallId")
+        # После звонка превью обновляется чаще
+        self._last_activity = time.monotonic()
+        self._idle_interval = PREVIEW_IDLE_INTERVAL
+        self._schedule_refresh()
+
         async def _fetch_and_set():
-            data = await self._http_get_bytes(photo_url)
-            if data:
-                await self._set_image(data)
+            data, digest = await self._previews.async_get(photo_url)
+            if data and not self._removed:
+                self._set_image(data, digest)
+                if self._tracer:
+                    self._tracer.mark(call_id, STAGE_PHOTO_DISPLAYED)
+
+        self.platform.config_entry.async_create_background_task(
+            self.hass, _fetch_and_set(), f"domonap_call_photo_{self._door_id}"
+        )
 
-        self.hass.async_create_task(_fetch_and_set())
+    @property
+    def _refresh_key(self) -> str:
+        return f"preview:{self._door_id}"
 
-    async def _set_image(self, data: bytes) -> None:
+    @callback
+    def _schedule_refresh(self) -> None:
+        if not self._photo_url:
+            return
+        if time.monotonic() - self._last_activity < PREVIEW_ACTIVE_WINDOW:
+            delay = PREVIEW_ACTIVE_INTERVAL
+        else:
+            delay = self._idle_interval
+        self._scheduler.schedule(self._refresh_key, delay, self._refresh_due)
+
+    @callback
+    def _refresh_due(self) -> None:
+        if self._removed:
+            return
+        self.platform.config_entry.async_create_background_task(
+            self.hass, self._async_refresh(), f"domonap_preview_{self._door_id}"
+        )
+
+    async def _async_refresh(self) -> None:
+        if self._removed:
+            return
+        try:
+            # Пока идёт вызов, показывается снимок звонящего
+            if self._photo_url and self._calls.active_call(self._door_id) is None:
+                data, digest = await self._previews.async_get(self._photo_url)
+                if self._removed:
+                    return
+                if data and digest != self._digest:
+                    self._set_image(data, digest)
+                    self._idle_interval = PREVIEW_IDLE_INTERVAL
+                else:
+                    # Картинка не меняется - опрашиваем всё реже
+                    self._idle_interval = min(self._idle_interval * 2, PREVIEW_IDLE_MAX)
+        finally:
+            if not self._removed:
+                self._schedule_refresh()
+
+    @callback
+    def _set_image(self, data: bytes, digest: Optional[bytes]) -> None:
         self._image_bytes = data
+        self._digest = digest
         self._attr_image_last_updated = dt_util.utcnow()
         self.async_write_ha_state()
-
-    async def _http_get_bytes(self, url: str) -> Optional[bytes]:
-        session = async_get_clientsession(self.hass)
-        try:
-            async with session.get(url) as resp:
-                if resp.status == 200:
-                    return await resp.read()
-                _LOGGER.debug("GET %s returned HTTP %s", url, resp.status)
-        except Exception:
-            _LOGGER.exception("Failed to GET %s", url)
-        return None
\ No newline at end of file
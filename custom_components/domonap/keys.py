@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, Optional
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers import device_registry as dr
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+from homeassistant.helpers.entity import Entity
+from homeassistant.helpers.storage import Store
+
+from .api import IntercomAPI
+from .const import DOMAIN, KEYS, KEYS_STORAGE_VERSION, SIGNAL_KEY_UPDATED
+
+_LOGGER = logging.getLogger(__name__)
+
+KeysListener = Callable[[list[dict[str, Any]], set[str]], None]
+
+
+def _keys_store(hass: HomeAssistant, entry_id: str) -> Store[dict[str, Any]]:
+    return Store(hass, KEYS_STORAGE_VERSION, f"{DOMAIN}.{entry_id}.keys")
+
+
+async def async_remove_snapshot(hass: HomeAssistant, entry_id: str) -> None:
+    await _keys_store(hass, entry_id).async_remove()
+
+
+@dataclass
+class KeysDiff:
+    added: list[dict[str, Any]] = field(default_factory=list)
+    changed: list[dict[str, Any]] = field(default_factory=list)
+    removed: set[str] = field(default_factory=set)
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.changed or self.removed)
+
+
+def diff_keys(old: Iterable[dict[str, Any]], new: Iterable[dict[str, Any]]) -> KeysDiff:
+    old_by_id = {key["id"]: key for key in old}
+    diff = KeysDiff()
+    seen: set[str] = set()
+    for key in new:
+        seen.add(key["id"])
+        previous = old_by_id.get(key["id"])
+        if previous is None:
+            diff.added.append(key)
+        elif previous != key:
+            diff.changed.append(key)
+    diff.removed = set(old_by_id) - seen
+    return diff
+
+
+class DomonapKeys:
+    """Keys of one account, persisted so entities can be created without the backend."""
+
+    def __init__(self, hass: HomeAssistant, entry_id: str, api: IntercomAPI) -> None:
+        self._hass = hass
+        self._entry_id = entry_id
+        self._api = api
+        self._store = _keys_store(hass, entry_id)
+        self._listeners: list[KeysListener] = []
+        self.keys: list[dict[str, Any]] = []
+        self.from_snapshot = False
+
+    async def async_load(self) -> bool:
+        """Loads the last successfully fetched keys from storage."""
+        data = await self._store.async_load()
+        if not data or not isinstance(data.get("keys"), list):
+            return False
+        self.keys = data["keys"]
+        self.from_snapshot = True
+        _LOGGER.debug("Loaded %s keys from snapshot", len(self.keys))
+        return True
+
+    async def async_fetch(self) -> Optional[list[dict[str, Any]]]:
+        try:
+            response = await self._api.get_paged_keys()
+        except Exception:
+            _LOGGER.warning("Failed to fetch keys", exc_info=True)
+            return None
+        if not isinstance(response, dict) or not isinstance(response.get("results"), list):
+            _LOGGER.warning("Unexpected keys response: %s", str(response)[:200])
+            return None
+        return response["results"]
+
+    async def async_refresh(self) -> Optional[KeysDiff]:
+        """Fetches keys and persists them. Returns None on failure, else the diff against the current list."""
+        keys = await self.async_fetch()
+        if keys is None:
+            return None
+        diff = diff_keys(self.keys, keys)
+        self.keys = keys
+        self.from_snapshot = False
+        if diff:
+            await self._store.async_save({"keys": keys})
+        return diff
+
+    @callback
+    def async_add_listener(self, listener: KeysListener) -> Callable[[], None]:
+        """Listener gets (added or changed keys, removed key ids) after each reconcile."""
+        self._listeners.append(listener)
+
+        @callback
+        def _remove() -> None:
+            self._listeners.remove(listener)
+
+        return _remove
+
+    async def async_reconcile(self) -> Optional[KeysDiff]:
+        """Refreshes keys and applies the diff to live entities without reloading the entry."""
+        diff = await self.async_refresh()
+        if not diff:
+            return diff
+        _LOGGER.debug(
+            "Keys changed: %s added, %s changed, %s removed",
+            len(diff.added),
+            len(diff.changed),
+            len(diff.removed),
+        )
+
+        device_registry = dr.async_get(self._hass)
+        # Отвязываем устройство от записи: без других записей оно удаляется вместе с сущностями
+        for key_id in diff.removed:
+            device = device_registry.async_get_device(identifiers={(DOMAIN, key_id)})
+            if device is not None:
+                device_registry.async_update_device(device.id, remove_config_entry_id=self._entry_id)
+
+        for key in diff.changed:
+            device = device_registry.async_get_device(identifiers={(DOMAIN, key["id"])})
+            if device is not None and device.name != key["name"]:
+                device_registry.async_update_device(device.id, name=key["name"])
+            async_dispatcher_send(self._hass, SIGNAL_KEY_UPDATED.format(key["id"]), key)
+
+        for listener in list(self._listeners):
+            listener(diff.added + diff.changed, diff.removed)
+        return diff
+
+
+@callback
+def async_setup_key_entities(
+    hass: HomeAssistant,
+    config_entry: ConfigEntry,
+    async_add_entities,
+    factory: Callable[[dict[str, Any]], Iterable[Entity]],
+) -> None:
+    """Adds entities for current keys and for keys that appear later."""
+    keys: DomonapKeys = hass.data[DOMAIN][config_entry.entry_id][KEYS]
+    known: dict[str, str] = {}
+
+    @callback
+    def _add(new_keys: list[dict[str, Any]], removed: set[str]) -> None:
+        for unique_id, key_id in list(known.items()):
+            if key_id in removed:
+                known.pop(unique_id)
+        entities = []
+        for key in new_keys:
+            try:
+                for entity in factory(key):
+                    if entity.unique_id in known:
+                        continue
+                    known[entity.unique_id] = key["id"]
+                    entities.append(entity)
+            except Exception:
+                _LOGGER.exception("Failed to create entities from key payload: %s", key)
+        if entities:
+            async_add_entities(entities)
+
+    _add(keys.keys, set())
+    config_entry.async_on_unload(keys.async_add_listener(_add))
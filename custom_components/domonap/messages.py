@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import logging
+from collections import OrderedDict, deque
+from typing import Any, Iterable, Optional
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+
+from .const import (
+    MESSAGE_CHANNELS,
+    MESSAGES_PER_CHANNEL,
+    SIGNAL_CHANNEL_REMOVED,
+    SIGNAL_MESSAGES,
+    SIGNAL_NEW_CHANNEL,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class ChatMessage:
+    __slots__ = ("id", "sender", "name", "text", "created", "is_read")
+
+    def __init__(self, data: dict[str, Any]) -> None:
+        self.id = data.get("id")
+        self.sender = data.get("sender")
+        self.name = data.get("name")
+        self.text = data.get("text")
+        self.created = data.get("createdOn")
+        self.is_read = bool(data.get("isRead"))
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "id": self.id,
+            "sender": self.sender,
+            "name": self.name,
+            "text": self.text,
+            "created": self.created,
+            "is_read": self.is_read,
+        }
+
+
+class ChatChannel:
+    __slots__ = ("channel", "chat_type", "messages", "unread")
+
+    def __init__(self, channel: str, chat_type: Optional[str], size: int) -> None:
+        self.channel = channel
+        self.chat_type = chat_type
+        self.messages: deque[ChatMessage] = deque(maxlen=size)
+        self.unread = 0
+
+
+class MessageStore:
+    """Recent chat messages of one account, bounded per channel and in channel count."""
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        entry_id: str,
+        per_channel: int = MESSAGES_PER_CHANNEL,
+        max_channels: int = MESSAGE_CHANNELS,
+    ) -> None:
+        self._hass = hass
+        self._entry_id = entry_id
+        self._per_channel = per_channel
+        self._max_channels = max_channels
+        self._channels: OrderedDict[str, ChatChannel] = OrderedDict()
+
+    def get(self, channel: str) -> Optional[ChatChannel]:
+        return self._channels.get(channel)
+
+    @property
+    def channels(self) -> list[str]:
+        return list(self._channels)
+
+    @property
+    def total_unread(self) -> int:
+        return sum(c.unread for c in self._channels.values())
+
+    @callback
+    def restore_channels(self, channel_ids: Iterable[str]) -> list[str]:
+        """Adds empty channels known from before a restart, returns those over the limit."""
+        dropped = []
+        for channel_id in channel_ids:
+            if channel_id in self._channels:
+                continue
+            if len(self._channels) >= self._max_channels:
+                dropped.append(channel_id)
+                continue
+            self._channels[channel_id] = ChatChannel(channel_id, None, self._per_channel)
+            # Восстановленные каналы считаются самыми давно неактивными
+            self._channels.move_to_end(channel_id, last=False)
+        return dropped
+
+    @callback
+    def add(self, data: dict[str, Any], username: str = "") -> None:
+        channel_id = data.get("channel")
+        if not channel_id:
+            return
+        channel = self._channels.get(channel_id)
+        created = channel is None
+        evicted = []
+        if created:
+            channel = self._channels[channel_id] = ChatChannel(channel_id, data.get("chatType"), self._per_channel)
+            # Самый давно неактивный канал вытесняется
+            while len(self._channels) > self._max_channels:
+                evicted.append(self._channels.popitem(last=False)[0])
+        else:
+            self._channels.move_to_end(channel_id)
+            if channel.chat_type is None:
+                channel.chat_type = data.get("chatType")
+
+        message = ChatMessage(data)
+        channel.messages.append(message)
+        if not message.is_read and (not username or message.sender != username):
+            channel.unread += 1
+
+        for evicted_id in evicted:
+            async_dispatcher_send(self._hass, SIGNAL_CHANNEL_REMOVED.format(self._entry_id), evicted_id)
+        if created:
+            async_dispatcher_send(self._hass, SIGNAL_NEW_CHANNEL.format(self._entry_id), channel_id)
+        async_dispatcher_send(self._hass, SIGNAL_MESSAGES.format(self._entry_id), channel_id)
+
+    @callback
+    def mark_read(self, channel_id: str) -> None:
+        channel = self._channels.get(channel_id)
+        if channel is None or not channel.unread:
+            return
+        channel.unread = 0
+        for message in channel.messages:
+            message.is_read = True
+        async_dispatcher_send(self._hass, SIGNAL_MESSAGES.format(self._entry_id), channel_id)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            channel_id: {"messages": len(c.messages), "unread": c.unread}
+            for channel_id, c in self._channels.items()
+        }
@@ -2,16 +2,28 @@ import json
 import logging
 import asyncio
 import aiohttp
+import time
 from random import randint
-from typing import Callable, Optional, Any, Iterable, Union
+from typing import Awaitable, Callable, Optional, Any, Iterable, Union
 from homeassistant.core import HomeAssistant
 from homeassistant.helpers.aiohttp_client import async_get_clientsession
 from .api import IntercomAPI
+from .events import EntryEventSink, EventSink
+from .tracing import CallTracer, STAGE_DECODED, STAGE_BUS_FIRED
+from .transports import FALLBACK_TRANSPORTS, TRANSPORT_WEBSOCKETS, available_transports
 from .const import (
-    EVENT_INCOMING_CALL,
+    EVENT_KIND_CALL,
+    EVENT_KIND_CALL_ENDED,
+    EVENT_KIND_MESSAGE,
+    EVENT_KIND_READ,
+    EVENT_KIND_PRESENCE,
+    CALL_END_EVENT_MESSAGES,
     WS_MESSAGE_END,
     WS_HANDSHAKE_MESSAGE,
     WS_URL,
+    WS_FALLBACK_AFTER,
+    TRANSPORT_UPGRADE_INTERVAL,
+    TRANSPORT_PROBE_TIMEOUT,
     PHOTO_URL,
 )
 
@@ -19,7 +31,23 @@ _LOGGER = logging.getLogger(__name__)
 
 
 class IntercomNotifyConsumer:
-    def __init__(self, hass: HomeAssistant, api: IntercomAPI) -> None:
+    """SignalR notification hub client of one account.
+
+    Decoded pushes go to sink as normalized (kind, data) events. Without a
+    sink they are fired on the HA bus; with an explicit sink and session the
+    consumer needs no HomeAssistant at all (see engine.py).
+    """
+
+    def __init__(
+        self,
+        hass: Optional[HomeAssistant],
+        api: IntercomAPI,
+        *,
+        session: Optional[aiohttp.ClientSession] = None,
+        ws_url: str = WS_URL,
+        sink: Optional[EventSink] = None,
+        connect_gate: Optional[Callable[[], Awaitable[None]]] = None,
+    ) -> None:
         self._hass = hass
         self._api = api
         self._callbacks: set[Callable[[], Union[None, Any]]] = set()
@@ -29,9 +57,21 @@ class IntercomNotifyConsumer:
         self._reconnect_delay: int = 1
         self._max_reconnect: int = 10
         self._stop_event = asyncio.Event()
-        self._session = async_get_clientsession(hass)
+        self._session = session if session is not None else async_get_clientsession(hass)
+        self._ws_url = ws_url
+        self._sink = sink if sink is not None else EntryEventSink(hass)
+        # Ожидание своей очереди на подключение (общий хаб разносит переподключения аккаунтов)
+        self._connect_gate = connect_gate
+        self.stats = {"connects": 0, "disconnects": 0, "errors": 0}
+        self.last_error: Optional[str] = None
+        self.connected_since: Optional[float] = None
         self._headers = {"Authorization": f"Bearer {self._api.access_token or ''}"}
-        self._ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        self._ws: Optional[Any] = None
+        self._transport: Optional[str] = None
+        self._ws_failures = 0
+        self.tracer = CallTracer()
+        self._frame_received_at: float = 0.0
+        self._frame_decoded_at: float = 0.0
         if hasattr(self._api, "token_update_callback") and self._api.token_update_callback is None:
             self._api.token_update_callback = self._on_token_update
 
@@ -39,10 +79,16 @@ class IntercomNotifyConsumer:
         self._stop_event.clear()
         while not self._stop_event.is_set():
             try:
+                if self._connect_gate is not None:
+                    await self._connect_gate()
+                    if self._stop_event.is_set():
+                        break
                 await self._connect_and_run()
             except asyncio.CancelledError:
                 raise
             except aiohttp.WSServerHandshakeError as e:
+                self.stats["errors"] += 1
+                self.last_error = f"handshake {e.status}"
                 if e.status == 401:
                     _LOGGER.error("WS 401 Unauthorized: %s", e.headers.get("WWW-Authenticate"))
                 elif e.status == 404:
@@ -50,6 +96,8 @@ class IntercomNotifyConsumer:
                 else:
                     _LOGGER.debug("WS handshake error: %s", e)
             except Exception as e:
+                self.stats["errors"] += 1
+                self.last_error = str(e) or type(e).__name__
                 _LOGGER.debug("Notify loop error: %s", e)
             if self._stop_event.is_set():
                 break
@@ -77,37 +125,150 @@ class IntercomNotifyConsumer:
     def _on_token_update(self, access: str, _refresh: str, _exp: str) -> None:
         self._headers["Authorization"] = f"Bearer {access}"
 
+    @property
+    def transport(self) -> Optional[str]:
+        return self._transport
+
     async def _connect_and_run(self) -> None:
-        self._notify_id_token = await self._api.get_notify_id_token()
+        # Токен мог обновиться без нашего колбэка (колбэк API занят владельцем)
+        self._headers["Authorization"] = f"Bearer {self._api.access_token or ''}"
+        negotiate = await self._api.negotiate()
+        self._notify_id_token = negotiate.get("connectionToken") if negotiate else None
         _LOGGER.debug("Negotiated connectionToken: %s", self._notify_id_token)
         if not self._notify_id_token:
             raise RuntimeError("Negotiation failed: empty connectionToken")
-        ws_url = WS_URL + self._notify_id_token
-        async with self._session.ws_connect(ws_url, headers=self._headers) as ws:
-            self._ws = ws
-            _LOGGER.debug("WS connected")
-            self._connected = True
-            self._reconnect_delay = 1
-            self._username = await self._api.get_username()
-            await ws.send_str(WS_HANDSHAKE_MESSAGE)
+        transports = available_transports(negotiate)
+        # Сервер без списка транспортов считаем поддерживающим только WebSockets
+        if not transports or (TRANSPORT_WEBSOCKETS in transports and self._ws_failures < WS_FALLBACK_AFTER):
+            try:
+                ws = await self._session.ws_connect(self._ws_url + self._notify_id_token, headers=self._headers)
+            except aiohttp.WSServerHandshakeError as e:
+                if e.status != 401:
+                    self._ws_failures += 1
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                self._ws_failures += 1
+                raise
+            await self._run_ws(ws)
+            return
+
+        fallback = next((name for name in FALLBACK_TRANSPORTS if name in transports), None)
+        if fallback is None:
+            raise RuntimeError(f"No supported transport in {transports}")
+        ws = await self._run_fallback(fallback, self._notify_id_token)
+        if ws is not None:
+            await self._run_ws(ws)
+
+    async def _run_ws(self, ws: aiohttp.ClientWebSocketResponse) -> None:
+        self._ws = ws
+        self._ws_failures = 0
+        try:
+            await self._on_connected(ws, TRANSPORT_WEBSOCKETS)
             async for msg in ws:
                 if self._stop_event.is_set():
                     break
                 if msg.type == aiohttp.WSMsgType.TEXT:
-                    await self._handle_text(msg.data, ws)
-                    if self._callbacks:
-                        await self._publish_updates()
+                    await self._handle_frame(msg.data, ws)
                 elif msg.type == aiohttp.WSMsgType.PING:
                     await ws.pong()
                 elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
                     _LOGGER.debug("WS closed/error: %s", msg.data)
                     break
+        finally:
+            self._on_disconnected()
+            if not ws.closed:
+                await ws.close()
+        _LOGGER.debug("WS disconnected")
+
+    async def _run_fallback(self, name: str, token: str) -> Optional[aiohttp.ClientWebSocketResponse]:
+        """Runs an HTTP transport, returns an open WebSocket if an upgrade probe succeeded."""
+        url = f"{self._api.base_url}/notificationHub/?id={token}"
+        transport = FALLBACK_TRANSPORTS[name](self._session, url, self._headers)
+        loop = asyncio.get_running_loop()
+        probe_at = loop.time() + TRANSPORT_UPGRADE_INTERVAL
+        probe: Optional[asyncio.Task] = None
+        upgraded: Optional[aiohttp.ClientWebSocketResponse] = None
+        received = False
+        self._ws = transport
+        try:
+            await transport.open()
+            await self._on_connected(transport, name)
+            _LOGGER.info("Notification hub connected over %s, WebSockets unavailable", name)
+            async for raw in transport:
+                received = True
+                if self._stop_event.is_set():
+                    break
+                if raw:
+                    await self._handle_frame(raw, transport)
+                # Проверяется на каждом кадре: SSE получает пинги каждые 15 с, long polling - ответ хотя бы раз в ~90 с
+                if probe is None and loop.time() >= probe_at:
+                    probe = asyncio.create_task(self._probe_ws())
+                elif probe is not None and probe.done():
+                    upgraded = None if probe.cancelled() or probe.exception() else probe.result()
+                    probe = None
+                    if upgraded is not None:
+                        _LOGGER.info("WebSockets available again, leaving %s", name)
+                        break
+                    probe_at = loop.time() + TRANSPORT_UPGRADE_INTERVAL
+        except Exception:
+            if not received:
+                # Запасной транспорт тоже не подключился: следующая попытка снова через WebSockets
+                self._ws_failures = 0
+            raise
+        finally:
+            if probe is not None:
+                probe.cancel()
+                if probe.done() and not probe.cancelled() and not probe.exception() and probe.result():
+                    await probe.result().close()
+            self._on_disconnected()
+            await transport.close()
+        _LOGGER.debug("%s disconnected", name)
+        return upgraded
+
+    async def _probe_ws(self) -> Optional[aiohttp.ClientWebSocketResponse]:
+        # Для нового подключения нужен свой connectionToken
+        negotiate = await self._api.negotiate()
+        if not negotiate or TRANSPORT_WEBSOCKETS not in available_transports(negotiate):
+            return None
+        try:
+            return await asyncio.wait_for(
+                self._session.ws_connect(self._ws_url + negotiate["connectionToken"], headers=self._headers),
+                TRANSPORT_PROBE_TIMEOUT,
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError, KeyError) as e:
+            _LOGGER.debug("WebSockets upgrade probe failed: %s", e)
+            return None
+
+    async def _on_connected(self, ws: Any, transport: str) -> None:
+        _LOGGER.debug("Connected over %s", transport)
+        self._connected = True
+        self._transport = transport
+        self.stats["connects"] += 1
+        self.connected_since = time.time()
+        self._reconnect_delay = 1
+        self._username = await self._api.get_username()
+        await ws.send_str(WS_HANDSHAKE_MESSAGE)
+
+    def _on_disconnected(self) -> None:
+        # Состояние сбрасывается и при обрыве с исключением
+        if self._connected:
+            self.stats["disconnects"] += 1
         self._connected = False
+        self._transport = None
+        self.connected_since = None
         self._username = ""
         self._ws = None
-        _LOGGER.debug("WS disconnected")
 
-    async def _handle_text(self, raw: str, ws: aiohttp.ClientWebSocketResponse) -> None:
+    async def _handle_frame(self, raw: str, ws: Any) -> None:
+        self._frame_received_at = time.monotonic()
+        # В одном кадре может прийти несколько записей
+        for record in raw.split(WS_MESSAGE_END):
+            if record:
+                await self._handle_text(record, ws)
+        if self._callbacks:
+            await self._publish_updates()
+
+    async def _handle_text(self, raw: str, ws: Any) -> None:
         payload = raw.rstrip(WS_MESSAGE_END)
         if payload == "{}":
             _LOGGER.debug("Handshake ack")
@@ -117,6 +278,7 @@ class IntercomNotifyConsumer:
         except json.JSONDecodeError:
             _LOGGER.debug("Non-JSON frame: %s", payload[:200])
             return
+        self._frame_decoded_at = time.monotonic()
         t = data.get("type")
         if t == 1:
             await self._handle_invocation(data, ws)
@@ -127,7 +289,7 @@ class IntercomNotifyConsumer:
         else:
             _LOGGER.debug("Unknown frame type=%s data=%s", t, payload[:200])
 
-    async def _handle_invocation(self, data: dict, ws: aiohttp.ClientWebSocketResponse) -> None:
+    async def _handle_invocation(self, data: dict, ws: Any) -> None:
         target = data.get("target")
         args: Iterable = data.get("arguments") or []
         if target == "ReceivePush":
@@ -135,9 +297,16 @@ class IntercomNotifyConsumer:
             if isinstance(push_data, dict):
                 evt = push_data.get("EventMessage")
                 if evt == "DomofonCalling":
-                    push_data["PhotoUrl"] = PHOTO_URL + str(push_data.get("CallId", ""))
-                    self._hass.bus.fire(EVENT_INCOMING_CALL, push_data)
+                    call_id = str(push_data.get("CallId", ""))
+                    push_data["PhotoUrl"] = PHOTO_URL + call_id
+                    trace = self.tracer.start(call_id, push_data.get("DoorId"), self._frame_received_at or None)
+                    trace.stages[STAGE_DECODED] = self._frame_decoded_at or time.monotonic()
+                    self._sink(EVENT_KIND_CALL, push_data)
+                    self.tracer.mark(call_id, STAGE_BUS_FIRED)
                     _LOGGER.debug("Incoming call: %s", push_data)
+                elif evt in CALL_END_EVENT_MESSAGES:
+                    self._sink(EVENT_KIND_CALL_ENDED, push_data)
+                    _LOGGER.debug("Call ended: %s", push_data)
                 else:
                     _LOGGER.debug("Unknown EventMessage=%s push=%s", evt, str(push_data)[:200])
         elif target in ('ReceiveOnline', "ReceiveOffline"):
@@ -145,8 +314,7 @@ class IntercomNotifyConsumer:
             status = data.get('target').replace('ReceiveO', 'o')
 
             _LOGGER.debug(f"User {user} is {status}")
-
-            self._hass.bus.fire("domonap_user_status_changed", {
+            self._sink(EVENT_KIND_PRESENCE, {
                 'user': user,
                 'status': status
             })
@@ -160,10 +328,12 @@ class IntercomNotifyConsumer:
 
         elif target == "ReceiveMessage":
             chat_data = data.get('arguments')[0]
-            self._hass.bus.fire("domonap_receive_message", chat_data)
+            self._sink(EVENT_KIND_MESSAGE, {"message": chat_data, "username": self._username})
             _LOGGER.debug(f"Received message from {chat_data.get('sender')}: {chat_data.get('text')}")
         elif target == 'ReceiveRead':
-            _LOGGER.debug(f"Read confirm messages in channel {data.get('arguments')[0]}")
+            channel = data.get('arguments')[0]
+            self._sink(EVENT_KIND_READ, {"channel": channel})
+            _LOGGER.debug(f"Read confirm messages in channel {channel}")
         else:
             _LOGGER.debug(f"Unknown target type {data.get('target')} message:\n{data}")
 
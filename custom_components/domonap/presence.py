@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import logging
+from typing import Any, Iterable, Optional
+
+from homeassistant.core import HomeAssistant, callback
+
+from .const import EVENT_USER_STATUS_CHANGED, PRESENCE_WINDOW
+from .scheduler import ExpiryScheduler
+
+_LOGGER = logging.getLogger(__name__)
+
+STATUS_ONLINE = "online"
+STATUS_OFFLINE = "offline"
+
+
+def parse_watched_users(value: str) -> set[str]:
+    return {user.strip() for user in (value or "").replace(";", ",").split(",") if user.strip()}
+
+
+class PresenceTable:
+    """Current online/offline status of building users.
+
+    A transition is committed only if it survives the debounce window, so a
+    user flapping online/offline/online inside the window produces no event.
+    Only committed changes of watched users (all users if none are watched)
+    reach the HA bus.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        scheduler: ExpiryScheduler,
+        window: float = PRESENCE_WINDOW,
+        watched: Iterable[str] = (),
+    ) -> None:
+        self._hass = hass
+        self._scheduler = scheduler
+        self._status: dict[str, str] = {}
+        self._pending: dict[str, str] = {}
+        self.window = window
+        self.watched: set[str] = set(watched)
+        self.stats = {"received": 0, "fired": 0, "coalesced": 0, "ignored": 0}
+
+    def configure(self, window: float, watched: Iterable[str]) -> None:
+        self.window = window
+        self.watched = set(watched)
+
+    def status(self, user: str) -> Optional[str]:
+        return self._status.get(user)
+
+    @property
+    def online(self) -> list[str]:
+        return [user for user, status in self._status.items() if status == STATUS_ONLINE]
+
+    @callback
+    def report(self, user: str, status: str) -> None:
+        self.stats["received"] += 1
+        if self.watched and user not in self.watched:
+            # Статус всё равно запоминаем, событие не нужно
+            self._status[user] = status
+            self.stats["ignored"] += 1
+            return
+
+        if status == self._status.get(user):
+            # Вернулся в прежнее состояние до истечения окна
+            if self._pending.pop(user, None) is not None:
+                self._scheduler.cancel(self._key(user))
+                self.stats["coalesced"] += 1
+            return
+
+        if self.window <= 0:
+            self._commit(user, status)
+            return
+        if self._pending.get(user) == status:
+            # Повтор ожидающего статуса не откладывает публикацию
+            return
+        if user in self._pending:
+            self.stats["coalesced"] += 1
+        self._pending[user] = status
+        self._scheduler.schedule(self._key(user), self.window, lambda: self._commit(user, self._pending.pop(user, status)))
+
+    @callback
+    def _commit(self, user: str, status: str) -> None:
+        if self._status.get(user) == status:
+            return
+        self._status[user] = status
+        self.stats["fired"] += 1
+        _LOGGER.debug("User %s is %s", user, status)
+        self._hass.bus.async_fire(EVENT_USER_STATUS_CHANGED, {"user": user, "status": status})
+
+    @staticmethod
+    def _key(user: str) -> str:
+        return f"presence:{user}"
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "window": self.window,
+            "watched": sorted(self.watched),
+            "tracked": len(self._status),
+            "online": len(self.online),
+            "pending": len(self._pending),
+            **self.stats,
+        }
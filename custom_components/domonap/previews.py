@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+import aiohttp
+
+from .const import PREVIEW_CACHE_SIZE, PREVIEW_SHARE_WINDOW
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class PreviewEntry:
+    __slots__ = ("etag", "last_modified", "digest", "data", "fetched")
+
+    def __init__(self) -> None:
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+        self.digest: Optional[bytes] = None
+        self.data: Optional[bytes] = None
+        self.fetched = 0.0
+
+
+class PreviewCache:
+    """Door preview downloads shared by the image and camera entities.
+
+    Concurrent requests for one URL share a single download. URLs requested
+    more than once are cached: a fresh copy is served from memory for
+    PREVIEW_SHARE_WINDOW seconds, and revalidation uses ETag / Last-Modified. Every image comes with its content hash, so a caller
+    can skip a picture it already shows, whoever downloaded it.
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, size: int = PREVIEW_CACHE_SIZE) -> None:
+        self._session = session
+        self._size = size
+        self._entries: OrderedDict[str, PreviewEntry] = OrderedDict()
+        # URL, запрошенные один раз: кэшируются только со второго запроса,
+        # чтобы разовые снимки звонков не вытесняли превью дверей
+        self._seen: OrderedDict[str, None] = OrderedDict()
+        self._inflight: dict[str, asyncio.Task] = {}
+        self.stats = {"requests": 0, "shared": 0, "not_modified": 0, "unchanged": 0, "changed": 0, "failed": 0}
+
+    async def async_get(
+        self, url: str, max_age: float = PREVIEW_SHARE_WINDOW
+    ) -> tuple[Optional[bytes], Optional[bytes]]:
+        """Returns (image, content hash), (None, None) if nothing was downloaded yet."""
+        entry = self._entries.get(url)
+        if entry is not None and entry.data is not None and time.monotonic() - entry.fetched < max_age:
+            self.stats["shared"] += 1
+            return entry.data, entry.digest
+        if (task := self._inflight.get(url)) is not None:
+            self.stats["shared"] += 1
+        else:
+            # Загрузка идёт отдельной задачей: отмена одного из ожидающих не отменяет её для остальных
+            task = self._inflight[url] = asyncio.get_running_loop().create_task(self._fetch(url))
+            task.add_done_callback(lambda done: self._fetch_done(url, done))
+        return await asyncio.shield(task)
+
+    def _fetch_done(self, url: str, task: asyncio.Task) -> None:
+        if self._inflight.get(url) is task:
+            del self._inflight[url]
+        if not task.cancelled() and (err := task.exception()) is not None:
+            _LOGGER.debug("Failed to GET %s: %s", url, err)
+
+    async def _fetch(self, url: str) -> tuple[Optional[bytes], Optional[bytes]]:
+        entry = self._entries.get(url)
+        if entry is not None:
+            self._entries.move_to_end(url)
+        elif url in self._seen:
+            del self._seen[url]
+            entry = self._entries[url] = PreviewEntry()
+            while len(self._entries) > self._size:
+                self._entries.popitem(last=False)
+        else:
+            entry = PreviewEntry()
+            self._seen[url] = None
+            while len(self._seen) > self._size:
+                self._seen.popitem(last=False)
+
+        headers = {}
+        if entry.data is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+
+        self.stats["requests"] += 1
+        try:
+            async with self._session.get(url, headers=headers) as resp:
+                if resp.status == 304 and entry.data is not None:
+                    entry.fetched = time.monotonic()
+                    self.stats["not_modified"] += 1
+                    return entry.data, entry.digest
+                if resp.status != 200:
+                    _LOGGER.debug("GET %s returned HTTP %s", url, resp.status)
+                    self.stats["failed"] += 1
+                    return entry.data, entry.digest
+                data = await resp.read()
+                entry.etag = resp.headers.get("ETag")
+                entry.last_modified = resp.headers.get("Last-Modified")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            _LOGGER.debug("Failed to GET %s: %s", url, err)
+            self.stats["failed"] += 1
+            return entry.data, entry.digest
+
+        entry.fetched = time.monotonic()
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        if digest == entry.digest:
+            # Сервер не поддерживает условные запросы, но картинка та же
+            self.stats["unchanged"] += 1
+        else:
+            entry.digest = digest
+            entry.data = data
+            self.stats["changed"] += 1
+        return entry.data, entry.digest
+
+    def as_dict(self) -> dict[str, Any]:
+        return {"cached": len(self._entries), **self.stats}
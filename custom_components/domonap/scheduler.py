@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import logging
+from typing import Callable, Optional
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.event import async_call_later
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def parse_hold_overrides(value: str) -> dict[str, float]:
+    """Parses "door_id=30, other_door_id=60" into {door_id: seconds}."""
+    result: dict[str, float] = {}
+    for item in (value or "").replace(";", ",").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        door_id, sep, seconds = item.partition("=")
+        if not sep or not door_id.strip():
+            raise ValueError(f"Invalid hold time override: {item}")
+        hold = float(seconds)
+        if hold <= 0:
+            raise ValueError(f"Hold time must be positive: {item}")
+        result[door_id.strip()] = hold
+    return result
+
+
+class ExpiryScheduler:
+    """Owns many deadlines with a single HA timer armed for the earliest one.
+
+    Deadlines live in a heap; rescheduling or cancelling a key only updates the
+    index, stale heap entries are skipped when they surface.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self._hass = hass
+        self._heap: list[tuple[float, int, str]] = []
+        self._entries: dict[str, tuple[float, int, Callable[[], None]]] = {}
+        self._seq = itertools.count()
+        self._timer: Optional[Callable[[], None]] = None
+        self._timer_deadline: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def deadline(self, key: str) -> Optional[float]:
+        entry = self._entries.get(key)
+        return entry[0] if entry else None
+
+    @callback
+    def schedule(self, key: str, delay: float, action: Callable[[], None]) -> None:
+        """Runs action after delay seconds, replacing any pending deadline for key."""
+        deadline = self._hass.loop.time() + delay
+        seq = next(self._seq)
+        self._entries[key] = (deadline, seq, action)
+        heapq.heappush(self._heap, (deadline, seq, key))
+        if self._timer_deadline is None or deadline < self._timer_deadline:
+            self._arm(deadline)
+
+    @callback
+    def cancel(self, key: str) -> bool:
+        # Запись в куче остаётся и будет пропущена при срабатывании
+        return self._entries.pop(key, None) is not None
+
+    @callback
+    def shutdown(self) -> None:
+        self._entries.clear()
+        self._heap.clear()
+        self._disarm()
+
+    def _arm(self, deadline: float) -> None:
+        self._disarm()
+        self._timer_deadline = deadline
+        self._timer = async_call_later(
+            self._hass, max(0.0, deadline - self._hass.loop.time()), self._fire
+        )
+
+    def _disarm(self) -> None:
+        if self._timer is not None:
+            self._timer()
+        self._timer = None
+        self._timer_deadline = None
+
+    @callback
+    def _fire(self, _now) -> None:
+        self._timer = None
+        self._timer_deadline = None
+        now = self._hass.loop.time()
+        while self._heap and self._heap[0][0] <= now:
+            _deadline, seq, key = heapq.heappop(self._heap)
+            entry = self._entries.get(key)
+            if entry is None or entry[1] != seq:
+                continue
+            del self._entries[key]
+            try:
+                entry[2]()
+            except Exception:
+                _LOGGER.exception("Expiry action for %s failed", key)
+        # Не даём куче разрастаться из-за отменённых записей
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = [(d, s, k) for d, s, k in self._heap if self._entries.get(k, (0, None))[1] == s]
+            heapq.heapify(self._heap)
+        if self._heap:
+            self._arm(self._heap[0][0])
@@ -3,49 +3,138 @@ from __future__ import annotations
 import logging
 from typing import Optional
 
-from homeassistant.components.sensor import SensorEntity
-from homeassistant.core import HomeAssistant
+from homeassistant.components.sensor import SensorDeviceClass, SensorEntity, SensorStateClass
+from homeassistant.const import EntityCategory, UnitOfTime
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.config_entries import ConfigEntry
+from homeassistant.helpers import entity_registry as er
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
 
-from .const import DOMAIN, API
+from .calls import CallRecord, CallRegistry
+from .const import (
+    DOMAIN,
+    API,
+    CALLS,
+    CALL_HISTORY_ATTR_SIZE,
+    LATENCY_SENSOR_ENDPOINTS,
+    MESSAGES,
+    SIGNAL_CALL_STATE,
+    SIGNAL_CHANNEL_REMOVED,
+    SIGNAL_KEY_UPDATED,
+    SIGNAL_MESSAGES,
+    SIGNAL_NEW_CHANNEL,
+)
+from .messages import MessageStore
+from .keys import async_setup_key_entities
 
 _LOGGER = logging.getLogger(__name__)
 
 
+def _account_device_info(entry_id: str, title: str):
+    return {
+        "identifiers": {(DOMAIN, entry_id)},
+        "name": f"Domonap {title}",
+        "manufacturer": "Domonap",
+        "model": "Account",
+    }
+
+
 async def async_setup_entry(hass: HomeAssistant, config_entry: ConfigEntry, async_add_entities):
-    entities: list[DomonapDoorCodeSensor] = []
     api = hass.data[DOMAIN][config_entry.entry_id][API]
+    calls = hass.data[DOMAIN][config_entry.entry_id][CALLS]
+    messages = hass.data[DOMAIN][config_entry.entry_id][MESSAGES]
 
-    response = await api.get_paged_keys()
-    keys = response.get("results", [])
-
-    for key in keys:
-        try:
-            key_id: str = key["id"]
-            door_id: str = key["doorId"]
-            door_name: str = key["name"]
-            pin: Optional[str] = key.get("domofonPublicPin")
-
-            if not pin:
-                _LOGGER.debug(
-                    "No domofonPublicPin for door %s (%s), skipping PIN sensor",
-                    door_id,
-                    door_name,
-                )
-                continue
+    def _entities(key) -> list[SensorEntity]:
+        key_id: str = key["id"]
+        door_id: str = key["doorId"]
+        door_name: str = key["name"]
+        pin: Optional[str] = key.get("domofonPublicPin")
+        entities: list[SensorEntity] = []
 
+        if key.get("httpVideoUrl") is not None:
             entities.append(
-                DomonapDoorCodeSensor(
+                DomonapCallHistorySensor(
+                    entry_id=config_entry.entry_id,
+                    calls=calls,
                     key_id=key_id,
                     door_id=door_id,
                     device_name=door_name,
-                    pin=pin,
                 )
             )
-        except Exception:
-            _LOGGER.exception("Failed to create PIN sensor from key payload: %s", key)
 
-    async_add_entities(entities, True)
+        if not pin:
+            _LOGGER.debug(
+                "No domofonPublicPin for door %s (%s), skipping PIN sensor",
+                door_id,
+                door_name,
+            )
+            return entities
+
+        entities.append(
+            DomonapDoorCodeSensor(
+                key_id=key_id,
+                door_id=door_id,
+                device_name=door_name,
+                pin=pin,
+            )
+        )
+        return entities
+
+    async_setup_key_entities(hass, config_entry, async_add_entities, _entities)
+
+    async_add_entities(
+        [
+            DomonapLatencySensor(config_entry, api, translation_key, path)
+            for translation_key, path in LATENCY_SENSOR_ENDPOINTS.items()
+        ]
+    )
+
+    # Сенсоры непрочитанных создаются по мере появления каналов и удаляются вместе с ними
+    channels: set[str] = set()
+    registry = er.async_get(hass)
+    channel_prefix = f"{config_entry.entry_id}_unread_"
+    total_unique_id = f"{config_entry.entry_id}_unread_messages"
+
+    def _channel_entity_id(channel: str) -> Optional[str]:
+        return registry.async_get_entity_id("sensor", DOMAIN, f"{channel_prefix}{channel}")
+
+    # Каналы из реестра сущностей: после перезапуска хранилище пустое, но сенсоры должны остаться доступными
+    registered = [
+        entity.unique_id[len(channel_prefix):]
+        for entity in er.async_entries_for_config_entry(registry, config_entry.entry_id)
+        if entity.domain == "sensor"
+        and entity.unique_id.startswith(channel_prefix)
+        and entity.unique_id != total_unique_id
+    ]
+    for channel in messages.restore_channels(registered):
+        if (entity_id := _channel_entity_id(channel)) is not None:
+            registry.async_remove(entity_id)
+
+    @callback
+    def _add_channels(*new_channels: str) -> None:
+        entities = []
+        for channel in new_channels:
+            if channel not in channels:
+                channels.add(channel)
+                entities.append(DomonapUnreadMessagesSensor(config_entry, messages, channel))
+        if entities:
+            async_add_entities(entities)
+
+    @callback
+    def _remove_channel(channel: str) -> None:
+        channels.discard(channel)
+        # Удаление из реестра убирает и саму сущность
+        if (entity_id := _channel_entity_id(channel)) is not None:
+            registry.async_remove(entity_id)
+
+    async_add_entities([DomonapUnreadMessagesSensor(config_entry, messages, None)])
+    _add_channels(*messages.channels)
+    config_entry.async_on_unload(
+        async_dispatcher_connect(hass, SIGNAL_NEW_CHANNEL.format(config_entry.entry_id), _add_channels)
+    )
+    config_entry.async_on_unload(
+        async_dispatcher_connect(hass, SIGNAL_CHANNEL_REMOVED.format(config_entry.entry_id), _remove_channel)
+    )
 
 
 class DomonapDoorCodeSensor(SensorEntity):
@@ -68,6 +157,20 @@ class DomonapDoorCodeSensor(SensorEntity):
     def native_value(self) -> str | None:
         return self._pin
 
+    async def async_added_to_hass(self) -> None:
+        self.async_on_remove(
+            async_dispatcher_connect(
+                self.hass, SIGNAL_KEY_UPDATED.format(self._key_id), self._handle_key_update
+            )
+        )
+
+    @callback
+    def _handle_key_update(self, key) -> None:
+        pin = key.get("domofonPublicPin")
+        if pin != self._pin:
+            self._pin = pin
+            self.async_write_ha_state()
+
     @property
     def device_info(self):
         # Имя устройства — это "дверь". Сущность будет называться "<device>: <translated entity name>"
@@ -76,4 +179,174 @@ class DomonapDoorCodeSensor(SensorEntity):
             "name": self._device_name,
             "manufacturer": "Domonap",
             "model": "Intercom Device",
-        }
\ No newline at end of file
+        }
+
+
+class DomonapCallHistorySensor(SensorEntity):
+    """Time of the last call to a door, with recent calls in attributes."""
+
+    _attr_has_entity_name = True
+    _attr_icon = "mdi:phone-log"
+    _attr_translation_key = "call_history"
+    _attr_device_class = SensorDeviceClass.TIMESTAMP
+    _attr_should_poll = False
+    # Список вызовов не пишем в recorder, он и так доступен через службу
+    _unrecorded_attributes = frozenset({"calls"})
+
+    def __init__(self, entry_id: str, calls: CallRegistry, key_id: str, door_id: str, device_name: str):
+        self._entry_id = entry_id
+        self._calls = calls
+        self._key_id = key_id
+        self._door_id = door_id
+        self._device_name = device_name
+
+    @property
+    def unique_id(self) -> str:
+        return f"{self._door_id}_call_history"
+
+    @property
+    def native_value(self):
+        recent = self._calls.history(self._door_id, limit=1)
+        return recent[0].started if recent else None
+
+    @property
+    def extra_state_attributes(self):
+        recent = self._calls.history(self._door_id, limit=CALL_HISTORY_ATTR_SIZE)
+        return {
+            "calls": [
+                {
+                    "call_id": r.call_id,
+                    "time": r.started.isoformat(),
+                    "address": r.address,
+                    "photo_url": r.photo_url,
+                    "state": r.state,
+                }
+                for r in recent
+            ]
+        }
+
+    async def async_added_to_hass(self) -> None:
+        self.async_on_remove(
+            async_dispatcher_connect(
+                self.hass, SIGNAL_CALL_STATE.format(self._entry_id), self._handle_call_state
+            )
+        )
+
+    @callback
+    def _handle_call_state(self, record: CallRecord) -> None:
+        if record.door_id == self._door_id:
+            self.async_write_ha_state()
+
+    @property
+    def device_info(self):
+        return {
+            "identifiers": {(DOMAIN, self._key_id)},
+            "name": self._device_name,
+            "manufacturer": "Domonap",
+            "model": "Intercom Device",
+        }
+
+
+class DomonapLatencySensor(SensorEntity):
+    """p95 latency of one API endpoint, estimated from the histogram in IntercomAPI."""
+
+    _attr_has_entity_name = True
+    _attr_icon = "mdi:timer-outline"
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
+    _attr_native_unit_of_measurement = UnitOfTime.MILLISECONDS
+    _attr_state_class = SensorStateClass.MEASUREMENT
+
+    def __init__(self, config_entry: ConfigEntry, api, translation_key: str, path: str):
+        self._entry_id = config_entry.entry_id
+        self._entry_title = config_entry.title
+        self._api = api
+        self._path = path
+        self._attr_translation_key = translation_key
+
+    @property
+    def unique_id(self) -> str:
+        return f"{self._entry_id}_{self._attr_translation_key}"
+
+    @property
+    def native_value(self) -> float | None:
+        stats = self._api.endpoint_stats.get(self._path)
+        return stats.percentile(0.95) if stats else None
+
+    @property
+    def extra_state_attributes(self):
+        stats = self._api.endpoint_stats.get(self._path)
+        if not stats:
+            return {"path": self._path}
+        data = stats.as_dict()
+        data.pop("histogram", None)
+        return {"path": self._path, **data}
+
+    @property
+    def device_info(self):
+        return _account_device_info(self._entry_id, self._entry_title)
+
+
+class DomonapUnreadMessagesSensor(SensorEntity):
+    """Unread chat messages in one channel, or in all channels when channel is None."""
+
+    _attr_has_entity_name = True
+    _attr_icon = "mdi:message-badge-outline"
+    _attr_should_poll = False
+    _attr_state_class = SensorStateClass.MEASUREMENT
+
+    def __init__(self, config_entry: ConfigEntry, messages: MessageStore, channel: Optional[str]):
+        self._entry_id = config_entry.entry_id
+        self._entry_title = config_entry.title
+        self._messages = messages
+        self._channel = channel
+        if channel is None:
+            self._attr_translation_key = "unread_messages_total"
+        else:
+            self._attr_translation_key = "unread_messages"
+            self._attr_translation_placeholders = {"channel": channel}
+
+    @property
+    def unique_id(self) -> str:
+        if self._channel is None:
+            return f"{self._entry_id}_unread_messages"
+        return f"{self._entry_id}_unread_{self._channel}"
+
+    @property
+    def native_value(self) -> int:
+        if self._channel is None:
+            return self._messages.total_unread
+        channel = self._messages.get(self._channel)
+        return channel.unread if channel else 0
+
+    @property
+    def extra_state_attributes(self):
+        if self._channel is None:
+            return None
+        channel = self._messages.get(self._channel)
+        if channel is None or not channel.messages:
+            return {"channel": self._channel}
+        last = channel.messages[-1]
+        return {
+            "channel": self._channel,
+            "chat_type": channel.chat_type,
+            "last_sender": last.name or last.sender,
+            "last_text": last.text,
+            "last_created": last.created,
+        }
+
+    async def async_added_to_hass(self) -> None:
+        self.async_on_remove(
+            async_dispatcher_connect(
+                self.hass, SIGNAL_MESSAGES.format(self._entry_id), self._handle_messages
+            )
+        )
+
+    @callback
+    def _handle_messages(self, channel: str) -> None:
+        if self._channel is None or channel == self._channel:
+            self.async_write_ha_state()
+
+    @property
+    def device_info(self):
+        return _account_device_info(self._entry_id, self._entry_title)
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any
+
+import homeassistant.helpers.config_validation as cv
+import voluptuous as vol
+from homeassistant.core import HomeAssistant, ServiceCall, ServiceResponse, SupportsResponse
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.util import dt as dt_util
+
+from .const import (
+    DOMAIN,
+    API,
+    KEYS,
+    CALLS,
+    SERVICE_OPEN_DOORS,
+    SERVICE_ANSWER_CALL,
+    SERVICE_END_CALL,
+    SERVICE_GET_CALL_HISTORY,
+    ATTR_KEYS,
+    ATTR_MAX_PARALLEL,
+    ATTR_CALL_ID,
+    ATTR_DOOR_ID,
+    ATTR_SINCE,
+    ATTR_LIMIT,
+    OPEN_DOORS_MAX_PARALLEL,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+OPEN_DOORS_SCHEMA = vol.Schema(
+    {
+        vol.Required(ATTR_KEYS): vol.All(cv.ensure_list, [cv.string]),
+        vol.Optional(ATTR_MAX_PARALLEL, default=OPEN_DOORS_MAX_PARALLEL): vol.All(
+            vol.Coerce(int), vol.Range(min=1, max=16)
+        ),
+    }
+)
+
+CALL_SCHEMA = vol.All(
+    vol.Schema(
+        {
+            vol.Optional(ATTR_CALL_ID): cv.string,
+            vol.Optional(ATTR_DOOR_ID): cv.string,
+        }
+    ),
+    cv.has_at_least_one_key(ATTR_CALL_ID, ATTR_DOOR_ID),
+)
+
+CALL_HISTORY_SCHEMA = vol.Schema(
+    {
+        vol.Optional(ATTR_DOOR_ID): cv.string,
+        vol.Optional(ATTR_SINCE): cv.positive_time_period,
+        vol.Optional(ATTR_LIMIT): vol.All(vol.Coerce(int), vol.Range(min=1)),
+    }
+)
+
+
+def _resolve_door(hass: HomeAssistant, ident: str) -> tuple[Any, str, str, str] | None:
+    """Ищет дверь по key id или door id среди всех аккаунтов."""
+    for stored in hass.data.get(DOMAIN, {}).values():
+        if KEYS not in stored:
+            continue
+        for key in stored[KEYS].keys:
+            if ident in (key["id"], key["doorId"]):
+                return stored[API], key["id"], key["doorId"], key["name"]
+    return None
+
+
+async def _async_open_doors(hass: HomeAssistant, call: ServiceCall) -> ServiceResponse:
+    semaphore = asyncio.Semaphore(call.data[ATTR_MAX_PARALLEL])
+    started = time.monotonic()
+
+    async def _open(ident: str) -> dict[str, Any]:
+        resolved = _resolve_door(hass, ident)
+        if resolved is None:
+            return {"key": ident, "ok": False, "error": "Unknown key or door"}
+        api, key_id, door_id, name = resolved
+        result: dict[str, Any] = {"key": ident, "key_id": key_id, "door_id": door_id, "name": name}
+        async with semaphore:
+            door_started = time.monotonic()
+            try:
+                response = await api.open_relay(key_id, door_id)
+                result["ok"] = isinstance(response, dict) and response.get("ok") is True
+                if not result["ok"]:
+                    result["error"] = str(response.get("error") if isinstance(response, dict) else response)
+            except Exception as e:
+                result["ok"] = False
+                result["error"] = str(e)
+            result["elapsed_ms"] = round((time.monotonic() - door_started) * 1000)
+        if not result["ok"]:
+            _LOGGER.error("Failed to open the door %s: %s", name, result.get("error"))
+        return result
+
+    results = await asyncio.gather(*(_open(ident) for ident in call.data[ATTR_KEYS]))
+    return {
+        "results": list(results),
+        "elapsed_ms": round((time.monotonic() - started) * 1000),
+    }
+
+
+def _resolve_call(hass: HomeAssistant, call: ServiceCall):
+    """Ищет вызов по CallId или активный вызов двери среди всех аккаунтов."""
+    call_id = call.data.get(ATTR_CALL_ID)
+    door_id = call.data.get(ATTR_DOOR_ID)
+    for stored in hass.data.get(DOMAIN, {}).values():
+        if CALLS not in stored:
+            continue
+        registry = stored[CALLS]
+        record = registry.get(call_id) if call_id else registry.active_call(door_id)
+        # Завершённый или пропущенный вызов уже нельзя ни принять, ни завершить
+        if record is not None and record.active:
+            return registry, record
+    raise HomeAssistantError(f"No active call for {call_id or door_id}")
+
+
+async def _async_call_action(hass: HomeAssistant, call: ServiceCall, answer: bool) -> ServiceResponse:
+    registry, record = _resolve_call(hass, call)
+    if answer:
+        res = await registry.async_answer(record.call_id)
+    else:
+        res = await registry.async_end(record.call_id)
+    if not isinstance(res, dict) or res.get("ok") is not True:
+        raise HomeAssistantError(f"Failed to update call {record.call_id}: {res}")
+    return {"call": record.as_dict()}
+
+
+async def _async_get_call_history(hass: HomeAssistant, call: ServiceCall) -> ServiceResponse:
+    door_id = call.data.get(ATTR_DOOR_ID)
+    since = dt_util.utcnow() - call.data[ATTR_SINCE] if ATTR_SINCE in call.data else None
+    limit = call.data.get(ATTR_LIMIT)
+    records = []
+    for stored in hass.data.get(DOMAIN, {}).values():
+        if CALLS in stored:
+            records.extend(stored[CALLS].history(door_id, since, limit))
+    records.sort(key=lambda r: r.started, reverse=True)
+    if limit:
+        records = records[:limit]
+    return {"calls": [record.as_dict() for record in records]}
+
+
+def async_setup_services(hass: HomeAssistant) -> None:
+    async def _handle_open_doors(call: ServiceCall) -> ServiceResponse:
+        return await _async_open_doors(hass, call)
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_OPEN_DOORS,
+        _handle_open_doors,
+        schema=OPEN_DOORS_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+
+    async def _handle_answer_call(call: ServiceCall) -> ServiceResponse:
+        return await _async_call_action(hass, call, answer=True)
+
+    async def _handle_end_call(call: ServiceCall) -> ServiceResponse:
+        return await _async_call_action(hass, call, answer=False)
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_ANSWER_CALL,
+        _handle_answer_call,
+        schema=CALL_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_END_CALL,
+        _handle_end_call,
+        schema=CALL_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+
+    async def _handle_get_call_history(call: ServiceCall) -> ServiceResponse:
+        return await _async_get_call_history(hass, call)
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_GET_CALL_HISTORY,
+        _handle_get_call_history,
+        schema=CALL_HISTORY_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+# Этапы доставки звонка: от WS-кадра до показанного фото
+STAGE_RECEIVED = "received"
+STAGE_DECODED = "decoded"
+STAGE_BUS_FIRED = "bus_fired"
+STAGE_STATE_WRITTEN = "state_written"
+STAGE_PHOTO_DISPLAYED = "photo_displayed"
+
+STAGES = (STAGE_RECEIVED, STAGE_DECODED, STAGE_BUS_FIRED, STAGE_STATE_WRITTEN, STAGE_PHOTO_DISPLAYED)
+
+
+class CallTrace:
+    __slots__ = ("call_id", "door_id", "started", "stages")
+
+    def __init__(self, call_id: str, door_id: Optional[str], received: float) -> None:
+        self.call_id = call_id
+        self.door_id = door_id
+        self.started = datetime.now(timezone.utc)
+        self.stages: dict[str, float] = {STAGE_RECEIVED: received}
+
+    def as_dict(self) -> dict[str, Any]:
+        received = self.stages[STAGE_RECEIVED]
+        return {
+            "call_id": self.call_id,
+            "door_id": self.door_id,
+            "started": self.started.isoformat(),
+            "stages_ms": {
+                stage: round((ts - received) * 1000, 1)
+                for stage, ts in self.stages.items()
+            },
+        }
+
+
+class CallTracer:
+    """Ring buffer of recent call traces keyed by CallId."""
+
+    def __init__(self, size: int = 50) -> None:
+        self._size = size
+        self._traces: OrderedDict[str, CallTrace] = OrderedDict()
+
+    def start(self, call_id: str, door_id: Optional[str] = None, received: Optional[float] = None) -> CallTrace:
+        trace = CallTrace(call_id, door_id, received if received is not None else time.monotonic())
+        self._traces[call_id] = trace
+        self._traces.move_to_end(call_id)
+        while len(self._traces) > self._size:
+            self._traces.popitem(last=False)
+        return trace
+
+    def get(self, call_id: Optional[str]) -> Optional[CallTrace]:
+        return self._traces.get(call_id) if call_id else None
+
+    def mark(self, call_id: Optional[str], stage: str, ts: Optional[float] = None) -> None:
+        trace = self._traces.get(call_id) if call_id else None
+        if trace is None or stage in trace.stages:
+            return
+        trace.stages[stage] = ts if ts is not None else time.monotonic()
+
+    def percentiles(self) -> dict[str, dict[str, float]]:
+        result: dict[str, dict[str, float]] = {}
+        for stage in STAGES[1:]:
+            samples = sorted(
+                (t.stages[stage] - t.stages[STAGE_RECEIVED]) * 1000
+                for t in self._traces.values()
+                if stage in t.stages
+            )
+            if not samples:
+                continue
+            result[stage] = {
+                "count": len(samples),
+                "p50_ms": round(samples[int((len(samples) - 1) * 0.5)], 1),
+                "p95_ms": round(samples[int((len(samples) - 1) * 0.95)], 1),
+                "max_ms": round(samples[-1], 1),
+            }
+        return result
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "percentiles": self.percentiles(),
+            "recent": [t.as_dict() for t in reversed(self._traces.values())],
+        }
@@ -0,0 +1,138 @@
+"""HTTP fallback transports for the SignalR notification hub.
+
+Used when WebSockets are not offered by negotiate or cannot be established.
+Both transports hand out raw text payloads, which may hold several
+\\x1e-terminated records, exactly as a WebSocket text frame would, and send
+records with a POST to the same connection URL.
+"""
+from __future__ import annotations
+
+import abc
+import logging
+import time
+from typing import AsyncIterator, Optional
+
+import aiohttp
+
+_LOGGER = logging.getLogger(__name__)
+
+TRANSPORT_WEBSOCKETS = "WebSockets"
+TRANSPORT_SSE = "ServerSentEvents"
+TRANSPORT_LONG_POLLING = "LongPolling"
+
+# Сервер держит long polling запрос до ~90 с, SSE присылает пинги каждые 15 с
+LONG_POLL_TIMEOUT = 120
+SSE_READ_TIMEOUT = 60
+
+
+def available_transports(negotiate: dict) -> list[str]:
+    result = []
+    for item in negotiate.get("availableTransports") or []:
+        if isinstance(item, dict) and "Text" in (item.get("transferFormats") or ["Text"]):
+            result.append(item.get("transport"))
+    return result
+
+
+class HttpTransport(abc.ABC):
+    name = ""
+
+    def __init__(self, session: aiohttp.ClientSession, url: str, headers: dict[str, str]) -> None:
+        self._session = session
+        self._url = url
+        self._headers = headers
+        self.closed = False
+
+    async def open(self) -> None:
+        """Opens the receive side, raises on failure."""
+
+    async def send_str(self, data: str) -> None:
+        async with self._session.post(
+            self._url,
+            data=data.encode(),
+            headers={**self._headers, "Content-Type": "text/plain;charset=UTF-8"},
+        ) as resp:
+            if resp.status == 404:
+                # Сервер уже забыл соединение
+                self.closed = True
+            resp.raise_for_status()
+
+    async def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            async with self._session.delete(self._url, headers=self._headers):
+                pass
+        except aiohttp.ClientError:
+            pass
+
+    def __aiter__(self) -> AsyncIterator[str]:
+        return self.receive()
+
+    @abc.abstractmethod
+    def receive(self) -> AsyncIterator[str]:
+        """Yields raw text payloads until the connection is closed."""
+
+
+class ServerSentEventsTransport(HttpTransport):
+    name = TRANSPORT_SSE
+
+    def __init__(self, session: aiohttp.ClientSession, url: str, headers: dict[str, str]) -> None:
+        super().__init__(session, url, headers)
+        self._resp: Optional[aiohttp.ClientResponse] = None
+
+    async def open(self) -> None:
+        self._resp = await self._session.get(
+            self._url,
+            headers={**self._headers, "Accept": "text/event-stream"},
+            timeout=aiohttp.ClientTimeout(total=None, sock_read=SSE_READ_TIMEOUT),
+        )
+        if self._resp.status != 200:
+            status = self._resp.status
+            self._resp.release()
+            raise aiohttp.ClientResponseError(
+                self._resp.request_info, (), status=status, message="SSE connect failed"
+            )
+
+    async def receive(self) -> AsyncIterator[str]:
+        data: list[str] = []
+        async for line in self._resp.content:
+            line = line.decode().rstrip("\r\n")
+            if line.startswith("data:"):
+                data.append(line[5:].lstrip(" "))
+            elif not line and data:
+                # Пустая строка завершает событие
+                yield "\n".join(data)
+                data = []
+        self.closed = True
+
+    async def close(self) -> None:
+        if self._resp is not None:
+            self._resp.close()
+        await super().close()
+
+
+class LongPollingTransport(HttpTransport):
+    name = TRANSPORT_LONG_POLLING
+
+    async def receive(self) -> AsyncIterator[str]:
+        while not self.closed:
+            async with self._session.get(
+                f"{self._url}&_={int(time.time() * 1000)}",
+                headers=self._headers,
+                timeout=aiohttp.ClientTimeout(total=LONG_POLL_TIMEOUT),
+            ) as resp:
+                if resp.status == 204:
+                    # Сервер закрыл соединение
+                    self.closed = True
+                    return
+                resp.raise_for_status()
+                text = await resp.text()
+            # Пустой ответ тоже отдаётся: вызывающий по нему проверяет таймеры
+            yield text
+
+
+FALLBACK_TRANSPORTS = {
+    TRANSPORT_SSE: ServerSentEventsTransport,
+    TRANSPORT_LONG_POLLING: LongPollingTransport,
+}
@@ -0,0 +1,197 @@
+"""Offline benchmarks for IntercomAPI and IntercomNotifyConsumer.
+
+Runs against FakeDomonapServer from fake_server.py, so every number is
+reproducible without touching the real backend:
+
+    python test/bench.py                 # all scenarios
+    python test/bench.py door_open       # one scenario
+    python test/bench.py --json out.json
+
+Requires aiohttp and homeassistant (the integration package imports it).
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_server import FakeDomonapServer, LatencyProfile  # noqa: E402
+from custom_components.domonap.api import IntercomAPI  # noqa: E402
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return round(ordered[int((len(ordered) - 1) * q)] * 1000, 2)
+
+    return {"count": len(ordered), "p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99), "max_ms": pick(1.0)}
+
+
+def make_api(server: FakeDomonapServer, **kwargs: Any) -> IntercomAPI:
+    api = IntercomAPI(base_url=server.base_url, **kwargs)
+    expires = (datetime.now(timezone.utc) + timedelta(days=30)).strftime("%Y-%m-%dT%H:%M:%S.%f%z")
+    api.set_tokens(server.access_token, server.refresh_token, expires)
+    return api
+
+
+class _Bus:
+    def __init__(self) -> None:
+        self.events: list[tuple[str, Any, float]] = []
+        self.waiter: Callable[[], None] | None = None
+
+    def fire(self, event_type: str, event_data: Any = None, *args: Any, **kwargs: Any) -> None:
+        self.events.append((event_type, event_data, time.monotonic()))
+        if self.waiter is not None:
+            self.waiter()
+
+    async_fire = fire
+
+
+class StubHass:
+    """Just enough of HomeAssistant for IntercomNotifyConsumer and the stores behind it.
+
+    Must be created inside a running loop: async_call_later (ExpiryScheduler)
+    arms timers on hass.loop and runs them through async_run_hass_job.
+    """
+
+    def __init__(self) -> None:
+        self.bus = _Bus()
+        self.data: dict[str, Any] = {}
+        self.loop = asyncio.get_running_loop()
+
+    def async_run_hass_job(self, job: Any, *args: Any) -> None:
+        job.target(*args)
+
+
+async def bench_throughput(args: argparse.Namespace) -> dict[str, Any]:
+    async with FakeDomonapServer() as server:
+        server.set_latency("*", LatencyProfile(base=args.latency))
+        async with make_api(server) as api:
+            await api.get_user()
+            done = 0
+            deadline = time.monotonic() + args.duration
+
+            async def worker() -> None:
+                nonlocal done
+                while time.monotonic() < deadline:
+                    await api.get_user()
+                    done += 1
+
+            started = time.monotonic()
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+            elapsed = time.monotonic() - started
+            return {
+                "concurrency": args.concurrency,
+                "requests": done,
+                "requests_per_s": round(done / elapsed, 1),
+                "endpoint": api.endpoint_stats["/sso-api/User/GetUser"].as_dict(),
+            }
+
+
+async def bench_door_open(args: argparse.Namespace) -> dict[str, Any]:
+    result: dict[str, Any] = {}
+    async with FakeDomonapServer() as server:
+        # Медленный хвост: каждое N-е открытие «зависает» на несколько секунд
+        profile = LatencyProfile(base=args.latency, jitter=args.latency, tail_ratio=args.tail_ratio, tail=args.tail)
+        server.set_latency("/client-api/Device/OpenRelayByKeyId", profile)
+        server.set_latency("/client-api/Device/OpenRelayByDoorId", profile)
+        key = server.keys[0]
+        for hedge in (False, True):
+            async with make_api(server, hedge_open_relay=hedge) as api:
+                samples = []
+                for _ in range(args.opens):
+                    started = time.monotonic()
+                    res = await api.open_relay(key.id, key.door_id)
+                    if res.get("ok") is True:
+                        samples.append(time.monotonic() - started)
+                result["hedged" if hedge else "plain"] = {
+                    **percentiles(samples),
+                    "hedge": dict(api.hedge_stats) if hedge else None,
+                }
+    return result
+
+
+async def bench_pushes(args: argparse.Namespace) -> dict[str, Any]:
+    from custom_components.domonap.notify_consumer import IntercomNotifyConsumer
+
+    async with FakeDomonapServer() as server:
+        hass = StubHass()
+        async with make_api(server) as api, aiohttp.ClientSession() as session:
+            consumer = IntercomNotifyConsumer(hass, api, session=session, ws_url=server.ws_url)
+            task = asyncio.create_task(consumer.start())
+            try:
+                while not (consumer.connected and server._sockets):
+                    await asyncio.sleep(0.01)
+                await asyncio.sleep(0.1)
+
+                all_seen = asyncio.Event()
+
+                def check() -> None:
+                    if len(hass.bus.events) >= args.pushes:
+                        all_seen.set()
+
+                hass.bus.waiter = check
+                started = time.monotonic()
+                await server.push_calls(args.pushes)
+                await asyncio.wait_for(all_seen.wait(), timeout=60)
+                elapsed = time.monotonic() - started
+                return {
+                    "pushes": args.pushes,
+                    "pushes_per_s": round(args.pushes / elapsed, 1),
+                    "stages": consumer.tracer.percentiles(),
+                }
+            finally:
+                await consumer.stop()
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+
+
+SCENARIOS = {
+    "throughput": bench_throughput,
+    "door_open": bench_door_open,
+    "pushes": bench_pushes,
+}
+
+
+async def _main(args: argparse.Namespace) -> dict[str, Any]:
+    results: dict[str, Any] = {}
+    for name in args.scenarios or SCENARIOS:
+        print(f"running {name}...", file=sys.stderr)
+        results[name] = await SCENARIOS[name](args)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Domonap offline benchmarks")
+    parser.add_argument("scenarios", nargs="*", help=f"any of: {', '.join(SCENARIOS)}")
+    parser.add_argument("--latency", type=float, default=0.02, help="base server latency, s")
+    parser.add_argument("--duration", type=float, default=5.0, help="throughput run time, s")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--opens", type=int, default=100)
+    parser.add_argument("--tail-ratio", type=float, default=0.05, help="share of slow door openings")
+    parser.add_argument("--tail", type=float, default=3.0, help="slow door opening latency, s")
+    parser.add_argument("--pushes", type=int, default=2000)
+    parser.add_argument("--json", dest="json_path", help="also write results to this file")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+    out = asyncio.run(_main(args))
+    text = json.dumps(out, indent=2, ensure_ascii=False)
+    print(text)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            f.write(text)
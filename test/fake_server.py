@@ -0,0 +1,432 @@
+"""Local stand-in for the Domonap backend.
+
+Implements the sso-api, client-api, communication-api, negotiate and SignalR
+notificationHub endpoints (WebSockets, Server-Sent Events and long polling)
+used by IntercomAPI and IntercomNotifyConsumer, with scriptable latency,
+errors and push bursts. Run standalone with
+
+    python test/fake_server.py --port 8765 --latency 0.05
+
+or start FakeDomonapServer from a benchmark / harness script.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+
+from aiohttp import web, WSMsgType
+
+_LOGGER = logging.getLogger(__name__)
+
+RECORD_END = "\x1e"
+
+
+@dataclass
+class LatencyProfile:
+    """Base delay plus uniform jitter, with an optional slow tail."""
+
+    base: float = 0.0
+    jitter: float = 0.0
+    tail_ratio: float = 0.0
+    tail: float = 0.0
+
+    def sample(self) -> float:
+        if self.tail_ratio and random.random() < self.tail_ratio:
+            return self.tail
+        return self.base + random.uniform(0, self.jitter)
+
+
+@dataclass
+class ErrorRule:
+    status: int
+    count: Optional[int] = None
+    ratio: float = 1.0
+
+
+@dataclass
+class FakeKey:
+    id: str
+    door_id: str
+    name: str
+    pin: Optional[str] = "1234"
+    video: bool = True
+
+    def as_payload(self, base_url: str) -> dict[str, Any]:
+        return {
+            "id": self.id,
+            "doorId": self.door_id,
+            "name": self.name,
+            "domofonPublicPin": self.pin,
+            "httpVideoUrl": f"{base_url}/hls/{self.door_id}/index.m3u8" if self.video else None,
+            "videoPreview": f"{base_url}/video-api/preview/Device/{self.door_id}" if self.video else None,
+        }
+
+
+@dataclass
+class ServerStats:
+    requests: dict[str, int] = field(default_factory=dict)
+    opened: list[str] = field(default_factory=list)
+    pushes_sent: int = 0
+    ws_connections: int = 0
+    sse_connections: int = 0
+    polls: int = 0
+    previews: int = 0
+
+
+def call_push_frame(door_id: str, call_id: Optional[str] = None, address: str = "Подъезд 1") -> str:
+    call_id = call_id or f"{random.randint(10**8, 10**9)}.{random.randint(10**7, 10**8)}"
+    push = {
+        "EventMessage": "DomofonCalling",
+        "DoorId": door_id,
+        "Address": address,
+        "CallId": call_id,
+        "PushType": "Domofon",
+    }
+    return json.dumps({"type": 1, "target": "ReceivePush", "arguments": ["", "", push]}) + RECORD_END
+
+
+class FakeDomonapServer:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        keys: Optional[list[FakeKey]] = None,
+        username: str = "resident",
+        ping_interval: float = 15.0,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.username = username
+        self.ping_interval = ping_interval
+        self.keys = keys if keys is not None else [
+            FakeKey(id=f"key{i}", door_id=f"door{i}", name=f"Door {i}") for i in range(3)
+        ]
+        self.access_token = "access-0"
+        self.refresh_token = "refresh-0"
+        self.latency: dict[str, LatencyProfile] = {}
+        self.errors: dict[str, ErrorRule] = {}
+        self.stats = ServerStats()
+        self.available_transports = ["WebSockets", "ServerSentEvents", "LongPolling"]
+        # Negotiate по-прежнему предлагает WebSockets, но апгрейд не проходит (как за прокси)
+        self.block_websockets = False
+        self._sockets: set[web.WebSocketResponse] = set()
+        self._streams: dict[str, asyncio.Queue[Optional[str]]] = {}
+        self._runner: Optional[web.AppRunner] = None
+        self._token_seq = 0
+
+    # --- scripting ---
+
+    def set_latency(self, path: str, profile: LatencyProfile) -> None:
+        """Delay every request to path ("*" matches all paths)."""
+        self.latency[path] = profile
+
+    def fail(self, path: str, status: int = 500, count: Optional[int] = None, ratio: float = 1.0) -> None:
+        self.errors[path] = ErrorRule(status, count, ratio)
+
+    def clear(self) -> None:
+        self.latency.clear()
+        self.errors.clear()
+
+    def expire_access_token(self) -> None:
+        """Makes the next authorized request return 401 until tokens are refreshed."""
+        self.access_token = f"expired-{uuid.uuid4().hex}"
+
+    async def broadcast(self, frame: str) -> int:
+        sent = 0
+        for ws in list(self._sockets):
+            if ws.closed:
+                continue
+            await ws.send_str(frame)
+            sent += 1
+        for queue in self._streams.values():
+            queue.put_nowait(frame)
+            sent += 1
+        return sent
+
+    async def push_calls(self, count: int, rate: Optional[float] = None, door_id: Optional[str] = None) -> None:
+        """Sends count DomofonCalling pushes, rate pushes/s (None - as fast as possible)."""
+        interval = 1 / rate if rate else 0
+        for i in range(count):
+            door = door_id or self.keys[i % len(self.keys)].door_id
+            self.stats.pushes_sent += await self.broadcast(call_push_frame(door))
+            if interval:
+                await asyncio.sleep(interval)
+
+    # --- lifecycle ---
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def ws_url(self) -> str:
+        return f"ws://{self.host}:{self.port}/notificationHub/?id="
+
+    async def start(self) -> None:
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_post("/sso-api/Authorization/Authorize", self._authorize)
+        app.router.add_post("/sso-api/Authorization/ConfirmAuthorization", self._confirm)
+        app.router.add_post("/sso-api/Authorization/RefreshToken", self._refresh)
+        app.router.add_post("/sso-api/Authorization/UpdateDeviceToken", self._text_ok)
+        app.router.add_post("/sso-api/User/GetUser", self._get_user)
+        app.router.add_post("/client-api/Key/GetPagedKeysByKeysType", self._get_keys)
+        app.router.add_post("/client-api/Key/GetUserKey", self._get_user_key)
+        app.router.add_post("/client-api/Device/OpenRelayByKeyId", self._open_by_key)
+        app.router.add_post("/client-api/Device/OpenRelayByDoorId", self._open_by_door)
+        app.router.add_post("/communication-api/Call/NotifyCallAnswered", self._text_ok)
+        app.router.add_post("/communication-api/Call/NotifyCallEnded", self._text_ok)
+        app.router.add_post("/notificationHub/negotiate", self._negotiate)
+        app.router.add_get("/notificationHub/", self._hub_get)
+        app.router.add_post("/notificationHub/", self._hub_send)
+        app.router.add_delete("/notificationHub/", self._hub_delete)
+        app.router.add_get("/video-api/preview/Device/{door_id}", self._preview)
+        app.router.add_get("/snapshot/{call_id}", self._preview)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        if not self.port:
+            self.port = self._runner.addresses[0][1]
+        _LOGGER.info("Fake Domonap server on %s", self.base_url)
+
+    async def stop(self) -> None:
+        for ws in list(self._sockets):
+            await ws.close()
+        for queue in self._streams.values():
+            queue.put_nowait(None)
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> "FakeDomonapServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.stop()
+
+    # --- handlers ---
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler):
+        path = request.path
+        self.stats.requests[path] = self.stats.requests.get(path, 0) + 1
+        profile = self.latency.get(path) or self.latency.get("*")
+        if profile is not None:
+            await asyncio.sleep(profile.sample())
+        rule = self.errors.get(path) or self.errors.get("*")
+        if rule is not None and (rule.count is None or rule.count > 0) and random.random() < rule.ratio:
+            if rule.count is not None:
+                rule.count -= 1
+            return web.Response(status=rule.status, text=json.dumps({"errorText": "scripted failure"}))
+        if path.startswith(("/client-api/", "/communication-api/", "/sso-api/User/", "/notificationHub/negotiate")):
+            if request.headers.get("Authorization") != f"Bearer {self.access_token}":
+                return web.Response(status=401)
+        try:
+            return await handler(request)
+        except ConnectionResetError:
+            # Клиент отменил запрос (например, проигравший хеджированный запрос)
+            return web.Response(status=499)
+
+    def _issue_tokens(self) -> dict[str, str]:
+        self._token_seq += 1
+        self.access_token = f"access-{self._token_seq}"
+        self.refresh_token = f"refresh-{self._token_seq}"
+        expires = datetime.now(timezone.utc) + timedelta(days=30)
+        return {
+            "accessToken": self.access_token,
+            "refreshToken": self.refresh_token,
+            "refreshExpirationDate": expires.strftime("%Y-%m-%dT%H:%M:%S.%f%z"),
+        }
+
+    async def _authorize(self, request: web.Request) -> web.Response:
+        return web.Response(text="")
+
+    async def _confirm(self, request: web.Request) -> web.Response:
+        return web.json_response({"completeToken": self._issue_tokens()})
+
+    async def _refresh(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        if body.get("refreshToken") != self.refresh_token:
+            return web.Response(status=401)
+        return web.json_response(self._issue_tokens())
+
+    async def _text_ok(self, request: web.Request) -> web.Response:
+        return web.Response(text="true")
+
+    async def _get_user(self, request: web.Request) -> web.Response:
+        return web.json_response({"userProfile": {"username": self.username}})
+
+    async def _get_keys(self, request: web.Request) -> web.Response:
+        results = [key.as_payload(self.base_url) for key in self.keys]
+        return web.json_response({"results": results, "totalCount": len(results)})
+
+    async def _get_user_key(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        for key in self.keys:
+            if key.id == body.get("keyId"):
+                return web.json_response(key.as_payload(self.base_url))
+        return web.Response(status=404)
+
+    async def _open_by_key(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        self.stats.opened.append(body.get("keyId"))
+        return web.Response(text="true")
+
+    async def _open_by_door(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        self.stats.opened.append(body.get("doorId"))
+        return web.Response(text="true")
+
+    async def _negotiate(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "negotiateVersion": 1,
+                "connectionId": uuid.uuid4().hex,
+                "connectionToken": uuid.uuid4().hex,
+                "availableTransports": [
+                    {"transport": name, "transferFormats": ["Text"]} for name in self.available_transports
+                ],
+            }
+        )
+
+    async def _preview(self, request: web.Request) -> web.Response:
+        # Фиксированная «картинка», чтобы можно было проверять условные запросы
+        body = b"\xff\xd8fake-jpeg\xff\xd9"
+        self.stats.previews += 1
+        if request.headers.get("If-None-Match") == '"fake-jpeg"':
+            return web.Response(status=304, headers={"ETag": '"fake-jpeg"'})
+        return web.Response(body=body, content_type="image/jpeg", headers={"ETag": '"fake-jpeg"'})
+
+    async def _hub_get(self, request: web.Request) -> web.StreamResponse:
+        if request.headers.get("Upgrade", "").lower() == "websocket":
+            return await self._hub_ws(request)
+        token = request.query.get("id", "")
+        if "text/event-stream" in request.headers.get("Accept", ""):
+            return await self._hub_sse(request, token)
+        return await self._hub_poll(request, token)
+
+    def _stream(self, token: str) -> asyncio.Queue[Optional[str]]:
+        queue = self._streams.get(token)
+        if queue is None:
+            queue = self._streams[token] = asyncio.Queue()
+        return queue
+
+    async def _hub_send(self, request: web.Request) -> web.Response:
+        queue = self._stream(request.query.get("id", ""))
+        for record in (await request.text()).split(RECORD_END):
+            if record.startswith('{"protocol"'):
+                queue.put_nowait("{}" + RECORD_END)
+        return web.Response(text="")
+
+    async def _hub_delete(self, request: web.Request) -> web.Response:
+        queue = self._streams.pop(request.query.get("id", ""), None)
+        if queue is not None:
+            queue.put_nowait(None)
+        return web.Response(status=202)
+
+    async def _hub_sse(self, request: web.Request, token: str) -> web.StreamResponse:
+        if "ServerSentEvents" not in self.available_transports:
+            return web.Response(status=404)
+        queue = self._stream(token)
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await resp.prepare(request)
+        self.stats.sse_connections += 1
+        try:
+            while True:
+                try:
+                    frame = await asyncio.wait_for(queue.get(), self.ping_interval)
+                except asyncio.TimeoutError:
+                    frame = '{"type":6}' + RECORD_END
+                if frame is None:
+                    break
+                await resp.write(f"data: {frame}\r\n\r\n".encode())
+        finally:
+            self._streams.pop(token, None)
+        return resp
+
+    async def _hub_poll(self, request: web.Request, token: str) -> web.Response:
+        if "LongPolling" not in self.available_transports:
+            return web.Response(status=404)
+        queue = self._stream(token)
+        self.stats.polls += 1
+        try:
+            frame = await asyncio.wait_for(queue.get(), self.ping_interval)
+        except asyncio.TimeoutError:
+            return web.Response(text="")
+        if frame is None:
+            return web.Response(status=204)
+        # Всё, что накопилось, отдаётся одним ответом
+        frames = [frame]
+        while not queue.empty():
+            frame = queue.get_nowait()
+            if frame is None:
+                queue.put_nowait(None)
+                break
+            frames.append(frame)
+        return web.Response(text="".join(frames))
+
+    async def _hub_ws(self, request: web.Request) -> web.StreamResponse:
+        if "WebSockets" not in self.available_transports or self.block_websockets:
+            return web.Response(status=403 if self.block_websockets else 404)
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.stats.ws_connections += 1
+        self._sockets.add(ws)
+        pinger = asyncio.create_task(self._ping_loop(ws))
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                for record in msg.data.split(RECORD_END):
+                    if record.startswith('{"protocol"'):
+                        await ws.send_str("{}" + RECORD_END)
+        finally:
+            pinger.cancel()
+            self._sockets.discard(ws)
+        return ws
+
+    async def _ping_loop(self, ws: web.WebSocketResponse) -> None:
+        while not ws.closed:
+            await asyncio.sleep(self.ping_interval)
+            await ws.send_str('{"type":6}' + RECORD_END)
+
+
+async def _main(args: argparse.Namespace) -> None:
+    server = FakeDomonapServer(host=args.host, port=args.port)
+    if args.latency or args.jitter:
+        server.set_latency("*", LatencyProfile(base=args.latency, jitter=args.jitter))
+    await server.start()
+    print(f"Fake Domonap server: {server.base_url} (ws: {server.ws_url}<token>)")
+    print(f"Access token: {server.access_token} refresh token: {server.refresh_token}")
+    try:
+        while True:
+            if args.push_every:
+                await asyncio.sleep(args.push_every)
+                await server.push_calls(args.push_burst)
+            else:
+                await asyncio.sleep(3600)
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="base latency, s")
+    parser.add_argument("--jitter", type=float, default=0.0, help="uniform jitter, s")
+    parser.add_argument("--push-every", type=float, default=0.0, help="send a push burst every N s")
+    parser.add_argument("--push-burst", type=int, default=1, help="pushes per burst")
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(_main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,237 @@
+"""Replay soak test for IntercomNotifyConsumer.
+
+Feeds SignalR frames (ReceivePush, ReceiveOnline/Offline, ReceiveMessage,
+ReceiveRead, pings) straight into the consumer's frame handler at a fixed
+rate and periodically reports event-loop lag, RSS and per-frame handling
+cost. Events go through the same sink as in HA, with the real call registry,
+message store, presence table and expiry scheduler; only hass.bus is stubbed:
+
+    python test/replay.py --rate 200 --duration 3600
+    python test/replay.py --frames captured.txt --rate 50 --report-every 60
+
+A capture file holds one raw SignalR frame per line (the trailing \\x1e
+record separator is optional). Without --frames a synthetic mix is used.
+Requires aiohttp and homeassistant (the integration package imports it).
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import resource
+import sys
+import time
+from types import SimpleNamespace
+from typing import Iterator
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench import StubHass, percentiles  # noqa: E402
+from fake_server import RECORD_END, call_push_frame  # noqa: E402
+from custom_components.domonap.api import IntercomAPI  # noqa: E402
+from custom_components.domonap.calls import CallRegistry  # noqa: E402
+from custom_components.domonap.const import PRESENCE_WINDOW  # noqa: E402
+from custom_components.domonap.events import EntryEventSink  # noqa: E402
+from custom_components.domonap.messages import MessageStore  # noqa: E402
+from custom_components.domonap.notify_consumer import IntercomNotifyConsumer  # noqa: E402
+from custom_components.domonap.presence import PresenceTable  # noqa: E402
+from custom_components.domonap.scheduler import ExpiryScheduler  # noqa: E402
+
+
+class ReplaySocket:
+    """Swallows what the consumer sends back (ping echoes)."""
+
+    def __init__(self) -> None:
+        self.sent = 0
+        self.closed = False
+
+    async def send_str(self, data: str) -> None:
+        self.sent += 1
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+def synthetic_frames(users: int = 500, doors: int = 20, channels: int = 50) -> Iterator[str]:
+    """Endless mix roughly shaped like a busy building."""
+    weights = (
+        ("online", 40),
+        ("offline", 40),
+        ("message", 10),
+        ("read", 5),
+        ("ping", 4),
+        ("call", 1),
+    )
+    kinds = [k for k, _ in weights]
+    cum = list(itertools.accumulate(w for _, w in weights))
+    seq = 0
+    while True:
+        seq += 1
+        kind = random.choices(kinds, cum_weights=cum)[0]
+        user = f"user{random.randrange(users)}"
+        channel = f"channel{random.randrange(channels)}"
+        if kind == "online":
+            yield json.dumps({"type": 1, "target": "ReceiveOnline", "arguments": [user]}) + RECORD_END
+        elif kind == "offline":
+            yield json.dumps({"type": 1, "target": "ReceiveOffline", "arguments": [user]}) + RECORD_END
+        elif kind == "message":
+            msg = {
+                "id": f"msg{seq}",
+                "channel": channel,
+                "text": "x" * random.randrange(10, 300),
+                "sender": user,
+                "name": user.title(),
+                "chatType": "Group",
+                "createdOn": "2025-06-18T15:02:32.1264693Z",
+                "isRead": False,
+            }
+            yield json.dumps({"type": 1, "target": "ReceiveMessage", "arguments": [msg]}) + RECORD_END
+        elif kind == "read":
+            yield json.dumps({"type": 1, "target": "ReceiveRead", "arguments": [channel]}) + RECORD_END
+        elif kind == "ping":
+            yield '{"type":6}' + RECORD_END
+        else:
+            yield call_push_frame(f"door{random.randrange(doors)}")
+
+
+def captured_frames(path: str) -> Iterator[str]:
+    with open(path, encoding="utf-8") as f:
+        frames = [line.rstrip("\n") for line in f if line.strip()]
+    if not frames:
+        raise SystemExit(f"{path}: no frames")
+    for frame in itertools.cycle(frames):
+        yield frame if frame.endswith(RECORD_END) else frame + RECORD_END
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        # Не Linux: только пиковое значение
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def measure_lag(interval: float, samples: list[float], stop: asyncio.Event) -> None:
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - started - interval))
+
+
+async def run(args: argparse.Namespace) -> None:
+    async with aiohttp.ClientSession() as session:
+        await replay(args, session)
+
+
+async def replay(args: argparse.Namespace, session: aiohttp.ClientSession) -> None:
+    hass = StubHass()
+    api = IntercomAPI()
+    # Хранилища те же, что создаёт async_setup_entry: их память и есть предмет проверки
+    entry = SimpleNamespace(entry_id="replay", options={})
+    scheduler = ExpiryScheduler(hass)
+    calls = CallRegistry(hass, entry, api, scheduler)
+    messages = MessageStore(hass, entry.entry_id)
+    presence = PresenceTable(hass, scheduler, args.presence_window)
+    sink = EntryEventSink(hass, calls=calls, messages=messages, presence=presence)
+    consumer = IntercomNotifyConsumer(hass, api, session=session, sink=sink)
+    ws = ReplaySocket()
+    for _ in range(args.callbacks):
+        consumer.register_callback(lambda: None)
+
+    frames = captured_frames(args.frames) if args.frames else synthetic_frames()
+    stop = asyncio.Event()
+    lag: list[float] = []
+    lag_task = asyncio.create_task(measure_lag(args.lag_interval, lag, stop))
+
+    handle_cost: list[float] = []
+    publish_cost: list[float] = []
+    publish_updates = consumer._publish_updates
+
+    async def timed_publish_updates() -> None:
+        t = time.perf_counter()
+        await publish_updates()
+        publish_cost.append(time.perf_counter() - t)
+
+    # Обновление сущностей вызывается из _handle_frame, его время считаем отдельно
+    consumer._publish_updates = timed_publish_updates
+    total = 0
+    started = time.monotonic()
+    next_report = started + args.report_every
+    interval = 1 / args.rate if args.rate else 0
+    deadline = started + args.duration
+    next_frame = started
+
+    try:
+        while time.monotonic() < deadline:
+            raw = next(frames)
+            published = len(publish_cost)
+            t0 = time.perf_counter()
+            # Тот же путь, что и у кадров WebSocket и HTTP-транспортов: запись за записью через \x1e
+            await consumer._handle_frame(raw, ws)
+            elapsed = time.perf_counter() - t0
+            handle_cost.append(elapsed - sum(publish_cost[published:]))
+            total += 1
+
+            now = time.monotonic()
+            if now >= next_report:
+                print(json.dumps({
+                    "elapsed_s": round(now - started, 1),
+                    "frames": total,
+                    "frames_per_s": round(len(handle_cost) / args.report_every, 1),
+                    "bus_events": len(hass.bus.events),
+                    "calls": len(calls.as_dict()),
+                    "channels": len(messages.channels),
+                    "presence": presence.as_dict(),
+                    "scheduled": len(scheduler),
+                    "rss_mb": round(rss_mb(), 1),
+                    "loop_lag": percentiles(lag),
+                    "handle": percentiles(handle_cost),
+                    "publish": percentiles(publish_cost),
+                }), flush=True)
+                # Окна отчёта независимы, чтобы было видно деградацию со временем
+                lag.clear()
+                handle_cost.clear()
+                publish_cost.clear()
+                hass.bus.events.clear()
+                next_report += args.report_every
+
+            if interval:
+                next_frame += interval
+                delay = next_frame - time.monotonic()
+                await asyncio.sleep(delay if delay > 0 else 0)
+            elif total % 100 == 0:
+                await asyncio.sleep(0)
+    finally:
+        stop.set()
+        scheduler.shutdown()
+        await lag_task
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Domonap notify consumer replay soak test")
+    parser.add_argument("--frames", help="capture file, one SignalR frame per line")
+    parser.add_argument("--rate", type=float, default=100.0, help="frames/s, 0 - as fast as possible")
+    parser.add_argument("--duration", type=float, default=60.0, help="run time, s")
+    parser.add_argument("--report-every", type=float, default=10.0, help="report interval, s")
+    parser.add_argument("--lag-interval", type=float, default=0.05, help="loop lag probe interval, s")
+    parser.add_argument("--callbacks", type=int, default=5, help="registered entity callbacks")
+    parser.add_argument(
+        "--presence-window", type=float, default=PRESENCE_WINDOW, help="presence debounce window, s"
+    )
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()